@@ -0,0 +1,18 @@
+"""
+ASGI config for cjapp project.
+
+It exposes the ASGI callable as a module-level variable named ``application``. Async views such as
+/process-logs/async/ run on the event loop; Django runs the synchronous DRF views in a worker thread
+(sync_to_async), so their database access stays off the loop.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cjapp.settings")
+
+application = get_asgi_application()
@@ -0,0 +1,24 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueFileHandler(QueueHandler):
+    """
+        Formats records in the calling thread and leaves writing them to filename to a background thread,
+        so a request never waits on disk I/O to log. logging.shutdown() at exit flushes what is queued.
+    """
+
+    def __init__(self, filename, encoding=None):
+        super().__init__(queue.SimpleQueue())
+        self.listener = QueueListener(self.queue, logging.FileHandler(filename, encoding=encoding))
+        self.listener.start()
+        self._listening = True
+
+    def close(self):
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+        super().close()
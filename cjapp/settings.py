@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'restapi.request_metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,10 +58,13 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'restapi.authentication.CachedTokenAuthentication',
     ],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
+# Seconds a token -> user lookup is reused by CachedTokenAuthentication, and how many are kept per process
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_MAX_ENTRIES = 10000
 DEFAULT_PORT = "8080"
 ROOT_URLCONF = 'cjapp.urls'
 
@@ -111,6 +115,40 @@ LOGGING = {
 
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+# Seconds a cached /balances/, /groups/{id}/balances/, /groups/{id}/expenses/ or /categories/ response is kept.
+# Writes retire cached responses right away through version keys in the same cache.
+RESPONSE_CACHE_TTL = 10 * 60
+
+# Background /process-logs/jobs/ runs. Jobs and their results are rows of restapi.LogJob, so every
+# server process sees them and cache eviction cannot lose them. While a job is unfinished its process
+# refreshes its heartbeat every LOG_JOB_HEARTBEAT seconds; one not refreshed for LOG_JOB_STALE_AFTER
+# seconds, e.g. because the worker was recycled mid-run, is reported as failed.
+LOG_JOB_WORKERS = 4
+LOG_JOB_RESULT_TTL = 60 * 60
+LOG_JOB_HEARTBEAT = 10
+LOG_JOB_STALE_AFTER = 60
+# Worker processes shared by parsingMode=process requests, started on first use
+LOG_PROCESS_WORKERS = min(4, os.cpu_count() or 1)
+# Number of log file urls whose aggregated counts are kept for revalidation
+LOG_CACHE_MAX_ENTRIES = 1024
+
+# Every response carries a Server-Timing header and a JSON 'restapi.request_metrics' log record.
+# Allocation tracing uses tracemalloc, which slows the whole process down, so it is off by default.
+REQUEST_METRICS_TRACE_ALLOCATIONS = False
+# Set to a number of milliseconds to sample the stacks of every request and keep the folded profiles
+# of those that took longer, for flamegraph.pl or speedscope
+REQUEST_PROFILE_THRESHOLD_MS = None
+REQUEST_PROFILE_INTERVAL_MS = 5
+REQUEST_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
 WSGI_APPLICATION = 'cjapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
@@ -0,0 +1,77 @@
+"""
+Production settings for cjapp: debug off, persistent database connections, SQLite in WAL mode, a cache
+shared by all server processes and logging that does not block requests.
+
+Select it with DJANGO_SETTINGS_MODULE=cjapp.settings_production (gunicorn.conf.py does). DJANGO_SECRET_KEY
+and DJANGO_ALLOWED_HOSTS (comma separated) must be set in the environment.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from cjapp.settings import *  # noqa: F401,F403
+from cjapp.settings import BASE_DIR, DATABASES, LOGGING
+
+
+def required_env(name):
+    value = os.environ.get(name, '').strip()
+    if not value:
+        raise ImproperlyConfigured("{} must be set for the production settings".format(name))
+    return value
+
+
+DEBUG = False
+
+# never the development key committed in cjapp/settings.py
+SECRET_KEY = required_env('DJANGO_SECRET_KEY')
+
+ALLOWED_HOSTS = [host.strip() for host in required_env('DJANGO_ALLOWED_HOSTS').split(',') if host.strip()]
+
+DATABASES = {
+    'default': dict(
+        DATABASES['default'],
+        # keep connections open across requests instead of reconnecting on each one
+        CONN_MAX_AGE=600,
+        OPTIONS={'timeout': 20},
+    )
+}
+
+# Applied to every new SQLite connection by restapi.apps. WAL lets readers run while a write is in
+# progress, which matters once several workers share the database file.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Response cache versions and background job results have to be visible to every worker process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+LOGGING = dict(
+    LOGGING,
+    handlers={
+        'file': {
+            'class': 'cjapp.log_handlers.QueueFileHandler',
+            'filename': os.environ.get('DJANGO_LOG_FILE', 'general.log'),
+            'level': 'INFO',
+            'formatter': 'verbose'
+        },
+    },
+    loggers={
+        '': {
+            'level': 'INFO',
+            'handlers': ['file'],
+        },
+    },
+)
@@ -0,0 +1,28 @@
+# Gunicorn settings for the production profile: gunicorn cjapp.wsgi:application -c gunicorn.conf.py
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '8080'))
+raw_env = ['DJANGO_SETTINGS_MODULE={}'.format(os.environ.get('DJANGO_SETTINGS_MODULE', 'cjapp.settings_production'))]
+
+# Processes for CPU-bound work (balances, log parsing); threads so that requests waiting on log
+# downloads or the database do not hold a whole process.
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# For the ASGI app (gunicorn cjapp.asgi:application) set
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornH11Worker; /process-logs/async/ downloads then wait on
+# the event loop instead of holding a thread each.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# /process-logs/ may wait up to FETCH_TIMEOUT per file; long batches belong on /process-logs/jobs/
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then so a slow leak cannot grow without bound. A /process-logs/jobs/ run
+# still going when its worker exits is lost; polling reports it as failed once LOG_JOB_STALE_AFTER passes.
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
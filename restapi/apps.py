@@ -2,7 +2,32 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+from restapi.request_metrics import install_query_recorder
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {}={}'.format(name, value))
 
 
 class RestapiConfig(AppConfig):
     name = 'restapi'
+
+    def ready(self):
+        connection_created.connect(apply_sqlite_pragmas)
+        connection_created.connect(install_query_recorder)
+
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        from restapi.authentication import revoke_deleted_token, revoke_user_tokens
+        post_delete.connect(revoke_deleted_token, sender=Token)
+        post_save.connect(revoke_user_tokens, sender=User)
@@ -0,0 +1,36 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+
+from restapi.http_pool import MAX_REDIRECTS, FetchError
+
+
+def client(timeout, max_connections):
+    """
+        Keep-alive httpx client shared by the downloads of one request, following redirects like
+        ConnectionPool
+    """
+    return httpx.AsyncClient(timeout=timeout, follow_redirects=True, max_redirects=MAX_REDIRECTS,
+                             limits=httpx.Limits(max_connections=max_connections))
+
+
+@asynccontextmanager
+async def request(client, url, headers=None):
+    """
+        GET url and yield the streaming response, raising FetchError for the failures ConnectionPool.request
+        raises it for, including those while the body is read
+    """
+    try:
+        async with client.stream('GET', url, headers=headers) as response:
+            if response.status_code >= 400:
+                raise FetchError(url, "HTTP {}".format(response.status_code), retryable=response.status_code >= 500)
+            yield response
+    except httpx.TimeoutException as e:
+        raise FetchError(url, asyncio.TimeoutError(str(e)))
+    except httpx.TooManyRedirects:
+        raise FetchError(url, "too many redirects", retryable=False)
+    except httpx.UnsupportedProtocol:
+        raise FetchError(url, "unsupported scheme", retryable=False)
+    except httpx.HTTPError as e:
+        raise FetchError(url, e)
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+class TTLCache(object):
+    """
+        Thread-safe mapping whose entries expire ttl seconds after they were stored, holding at most
+        max_entries of them (least recently used go first)
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _clone(instance):
+    fields = instance._meta.concrete_fields
+    return type(instance).from_db(instance._state.db, [field.attname for field in fields],
+                                  [getattr(instance, field.attname) for field in fields])
+
+
+token_cache = TTLCache(settings.TOKEN_CACHE_TTL, settings.TOKEN_CACHE_MAX_ENTRIES)
+
+
+def _revoked_key(key):
+    return 'token-revoked:{}'.format(key)
+
+
+def revoke(key):
+    """
+        Stop reusing cached lookups of the token key, in this process right away and in the others on their
+        next request through the revocation mark in the shared cache. Runs once the transaction commits.
+    """
+    def mark():
+        token_cache.invalidate(key)
+        # a cached lookup older than the mark is redone; newer ones outlive it after TOKEN_CACHE_TTL anyway
+        cache.set(_revoked_key(key), time.time(), settings.TOKEN_CACHE_TTL)
+    transaction.on_commit(mark)
+
+
+def revoke_deleted_token(sender, instance, **kwargs):
+    revoke(instance.key)
+
+
+def revoke_user_tokens(sender, instance, created=False, **kwargs):
+    # any change to the user, including is_active, makes cached copies of it stale
+    if created:
+        return
+    from rest_framework.authtoken.models import Token
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        revoke(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        TokenAuthentication that keeps token -> user resolutions in token_cache, saving the token/user
+        query on most requests. A local hit is checked against the revocation mark revoke() leaves in the
+        shared cache when the token is deleted (logout, admin) or its user changes (e.g. is_active).
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            revoked = cache.get(_revoked_key(key))
+            if revoked is not None and revoked >= cached[0]:
+                cached = None
+        if cached is None:
+            looked_up = time.time()
+            cached = (looked_up,) + tuple(super().authenticate_credentials(key))
+            token_cache.put(key, cached)
+        # fresh instances, so requests never share relations or other state cached on them
+        user, token = _clone(cached[1]), _clone(cached[2])
+        token.user = user
+        return user, token
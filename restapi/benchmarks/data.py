@@ -0,0 +1,88 @@
+"""
+    Synthetic data for the benchmark command: users, groups and expense histories written with bulk inserts,
+    and log files in the "<id> <epoch_ms> <exception>" format /process-logs/ parses.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from restapi.models import Category, Expenses, GroupBalance, Groups, UserExpense
+
+BATCH_SIZE = 5000
+WORDS = ['dinner', 'taxi', 'groceries', 'rent', 'movie', 'coffee', 'hotel', 'flight', 'lunch', 'fuel']
+EXCEPTIONS = ['NullPointerException', 'IllegalArgumentException', 'IllegalStateException', 'TimeoutException',
+              'ConcurrentModificationException']
+LOG_START_MS = 1623000000000
+
+
+def _next_id(model):
+    # SQLite cannot return ids from bulk_create on this Django version, so new rows get explicit ids
+    last = model.objects.order_by('-id').values_list('id', flat=True).first()
+    return (last or 0) + 1
+
+
+def create_users(count, prefix='bench'):
+    password = make_password('benchmark')
+    User.objects.bulk_create([User(username='{}{}'.format(prefix, i), password=password) for i in range(count)],
+                             batch_size=BATCH_SIZE)
+    return list(User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+
+
+def create_groups(user_ids, count, size, rng):
+    """
+        count groups of size random members each; returns {group id: [member ids]}
+    """
+    first_id = _next_id(Groups)
+    groups = {first_id + i: rng.sample(user_ids, min(size, len(user_ids))) for i in range(count)}
+    Groups.objects.bulk_create([Groups(id=group_id, name='{} group {}'.format(rng.choice(WORDS), group_id))
+                                for group_id in groups], batch_size=BATCH_SIZE)
+    Membership = Groups.members.through
+    Membership.objects.bulk_create([Membership(groups_id=group_id, user_id=user_id)
+                                    for group_id, members in groups.items() for user_id in members],
+                                   batch_size=BATCH_SIZE)
+    return groups
+
+
+def create_expenses(rows, user_ids, groups, rng, max_participants=6):
+    """
+        Expenses with about rows UserExpense rows in total, each split evenly and paid by one participant.
+        Roughly a quarter are outside any group. The group ledger is filled to match.
+    """
+    category = Category.objects.create(name='benchmark')
+    group_ids = list(groups)
+    next_id = _next_id(Expenses)
+    expenses, user_expenses, ledger = [], [], {}
+    created = 0
+    while created < rows:
+        group_id = rng.choice(group_ids) if group_ids and rng.random() < 0.75 else None
+        pool = groups[group_id] if group_id is not None else user_ids
+        participants = rng.sample(pool, min(len(pool), rng.randint(2, max_participants)))
+        total = rng.randint(100, 100000)
+        share, remainder = divmod(total, len(participants))
+        payer = rng.choice(participants)
+        expenses.append(Expenses(id=next_id, description='{} {}'.format(rng.choice(WORDS), next_id),
+                                 total_amount=Decimal(total) / 100, group_id=group_id, category=category))
+        for i, user_id in enumerate(participants):
+            owed = share + (remainder if i == 0 else 0)
+            lent = total if user_id == payer else 0
+            user_expenses.append(UserExpense(expense_id=next_id, user_id=user_id, amount_owed=Decimal(owed) / 100,
+                                             amount_lent=Decimal(lent) / 100))
+            if group_id is not None:
+                ledger[(group_id, user_id)] = ledger.get((group_id, user_id), 0) + lent - owed
+        next_id += 1
+        created += len(participants)
+        if len(user_expenses) >= BATCH_SIZE:
+            Expenses.objects.bulk_create(expenses)
+            UserExpense.objects.bulk_create(user_expenses)
+            expenses, user_expenses = [], []
+    Expenses.objects.bulk_create(expenses)
+    UserExpense.objects.bulk_create(user_expenses)
+    GroupBalance.objects.bulk_create([GroupBalance(group_id=group_id, user_id=user_id, amount=Decimal(cents) / 100)
+                                      for (group_id, user_id), cents in ledger.items()], batch_size=BATCH_SIZE)
+    return created
+
+
+def synthetic_log(lines, rng, span_ms=2 * 24 * 60 * 60 * 1000):
+    return '\n'.join('{} {} {}'.format(i, LOG_START_MS + rng.randrange(span_ms), rng.choice(EXCEPTIONS))
+                     for i in range(lines)).encode('utf-8')
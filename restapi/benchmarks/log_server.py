@@ -0,0 +1,69 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def etag(body):
+    return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+
+class LogServer(object):
+    """
+        Local HTTP/1.1 stand-in for the log file hosts, serving files[i] at /<i>.log with an ETag and
+        answering a matching If-None-Match with a 304. files may be replaced while the server runs;
+        statuses records the status of every response, in order.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.statuses = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = server.file(self.path)
+                if body is None:
+                    self.reply(404, b'')
+                elif etag(body) in self.headers.get('If-None-Match', ''):
+                    self.reply(304, None, etag(body))
+                else:
+                    self.reply(200, body, etag(body))
+
+            def reply(self, status, body, tag=None):
+                server.statuses.append(status)
+                self.send_response(status)
+                if tag is not None:
+                    self.send_header('ETag', tag)
+                if body is not None:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def file(self, path):
+        name = path.lstrip('/')
+        if not name.endswith('.log') or not name[:-len('.log')].isdigit():
+            return None
+        index = int(name[:-len('.log')])
+        return self.files[index] if index < len(self.files) else None
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def urls(self):
+        host, port = self.server.server_address
+        return ['http://{}:{}/{}.log'.format(host, port, i) for i in range(len(self.files))]
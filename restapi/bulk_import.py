@@ -0,0 +1,98 @@
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connections, transaction
+
+from restapi import ledger
+from restapi.models import Category, Expenses, Groups, UserExpense
+from restapi.response_cache import expense_scopes, invalidate
+from restapi.serializers import ExpensesSerializer
+
+BULK_CHUNK_SIZE = 500
+
+
+def _ids(values):
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+def _related_objects(rows):
+    user_ids, category_ids, group_ids = [], [], []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        category_ids.append(row.get('category'))
+        group_ids.append(row.get('group'))
+        if isinstance(row.get('users'), list):
+            user_ids.extend(user.get('user') for user in row['users'] if isinstance(user, dict))
+    return {
+        User: User.objects.in_bulk(_ids(user_ids)),
+        Category: Category.objects.in_bulk(_ids(category_ids)),
+        Groups: Groups.objects.in_bulk(_ids(group_ids)),
+    }
+
+
+def _validate(rows, first_row):
+    context = {'related_objects': _related_objects(rows)}
+    valid, errors = [], []
+    for i, row in enumerate(rows, start=first_row):
+        if isinstance(row, Exception):
+            errors.append({"row": i, "errors": [str(row)]})
+            continue
+        serializer = ExpensesSerializer(data=row, context=context)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+        else:
+            errors.append({"row": i, "errors": serializer.errors})
+    return valid, errors
+
+
+@transaction.atomic
+def _write(valid):
+    expenses = [Expenses(**{k: v for k, v in data.items() if k != 'users'}) for data in valid]
+    if connections[Expenses.objects.db].features.can_return_rows_from_bulk_insert:
+        Expenses.objects.bulk_create(expenses)
+    else:
+        # without RETURNING the new ids are unknown after a bulk insert, and the participant rows need them
+        for expense in expenses:
+            expense.save()
+    UserExpense.objects.bulk_create(
+        [UserExpense(expense=expense, **user) for expense, data in zip(expenses, valid) for user in data['users']],
+        batch_size=BULK_CHUNK_SIZE,
+    )
+    group_dues = {}
+    for expense, data in zip(expenses, valid):
+        dues = group_dues.setdefault(expense.group_id, {})
+        for user_id, due in ledger.expense_dues(data['users']).items():
+            dues[user_id] = dues.get(user_id, 0) + due
+    for group_id, dues in group_dues.items():
+        ledger.apply(group_id, dues)
+        invalidate(expense_scopes(group_id, dues.keys()))
+    return expenses
+
+
+def import_expenses(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+        Validate and insert expenses chunk by chunk, each chunk in its own transaction. Returns the number
+        of expenses created and the errors of the rejected rows, by row number.
+    """
+    rows = iter(rows)
+    created, errors, first_row = 0, [], 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid, chunk_errors = _validate(chunk, first_row)
+        errors.extend(chunk_errors)
+        if valid:
+            try:
+                created += len(_write(valid))
+            except DatabaseError as e:
+                errors.append({"rows": [first_row, first_row + len(chunk) - 1], "errors": [str(e)]})
+        first_row += len(chunk)
+    return created, errors
@@ -4,4 +4,9 @@ from rest_framework.exceptions import APIException
 class UnauthorizedUserException(APIException):
     status_code = 404
     default_detail = "Not Found"
-    default_code = "Records unavailable"
\ No newline at end of file
+    default_code = "Records unavailable"
+
+class LogFormatError(ValueError):
+    """
+        A fetched log file has lines that are not '<id> <epoch_ms> <exception>'
+    """
@@ -0,0 +1,100 @@
+import http.client
+import threading
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlsplit
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    def __init__(self, url, reason, retryable=True):
+        super().__init__("Failed to fetch {}: {}".format(url, reason))
+        self.url = url
+        self.reason = reason
+        self.retryable = retryable
+
+    def __reduce__(self):
+        # keeps the exception picklable when it is raised in a worker process
+        return FetchError, (self.url, str(self.reason), self.retryable)
+
+
+class ConnectionPool(object):
+    """
+        Keep-alive HTTP(S) connections shared between fetch workers, reused per host
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _acquire(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+    @contextmanager
+    def request(self, url, headers=None):
+        """
+            GET url following redirects and yield the open response. The connection goes back to the
+            pool when the body was read to the end, otherwise it is closed.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise FetchError(url, "unsupported scheme", retryable=False)
+            path = parts.path or '/'
+            if parts.query:
+                path = "{}?{}".format(path, parts.query)
+            conn = self._acquire(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise FetchError(url, e)
+
+            if response.status in REDIRECT_STATUSES and response.getheader('Location'):
+                response.read()
+                self._finish(parts, conn, response)
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            if response.status >= 400:
+                response.read()
+                self._finish(parts, conn, response)
+                raise FetchError(url, "HTTP {}".format(response.status), retryable=response.status >= 500)
+
+            try:
+                yield response
+            finally:
+                self._finish(parts, conn, response)
+            return
+        raise FetchError(url, "too many redirects", retryable=False)
+
+    def _finish(self, parts, conn, response):
+        if response.isclosed() and not response.will_close:
+            self._release(parts.scheme, parts.netloc, conn)
+        else:
+            conn.close()
@@ -0,0 +1,111 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from restapi.custom_exception import LogFormatError
+from restapi.http_pool import FetchError
+from restapi.models import LogJob
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCESS = 'success'
+FAILURE = 'failure'
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=settings.LOG_JOB_WORKERS, thread_name_prefix='log-job')
+
+# ids of the unfinished jobs of this process, whose heartbeat _beat keeps fresh
+_active = set()
+_lock = threading.Lock()
+_heartbeat = None
+
+
+def _owner():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _beat():
+    while True:
+        time.sleep(settings.LOG_JOB_HEARTBEAT)
+        with _lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        try:
+            LogJob.objects.filter(id__in=job_ids).update(heartbeat=timezone.now())
+        except DatabaseError:
+            logger.exception("Could not refresh the heartbeat of log jobs %s", job_ids)
+        finally:
+            connection.close()
+
+
+def _start_heartbeat():
+    global _heartbeat
+    # threads do not survive a fork, so a forked worker starts its own
+    if _heartbeat is None or not _heartbeat.is_alive():
+        _heartbeat = threading.Thread(target=_beat, name='log-job-heartbeat', daemon=True)
+        _heartbeat.start()
+
+
+def _save(job_id, status, response=None, reason=''):
+    LogJob.objects.filter(id=job_id).update(status=status, response=response, reason=reason,
+                                            heartbeat=timezone.now())
+
+
+def get(job_id):
+    """
+        The job as served by /process-logs/jobs/{id}/, or None if it is unknown or older than
+        LOG_JOB_RESULT_TTL. An unfinished job whose owner stopped refreshing its heartbeat, because the
+        process was recycled or killed, is reported as failed.
+    """
+    now = timezone.now()
+    job = LogJob.objects.filter(id=job_id, created__gte=now - timedelta(seconds=settings.LOG_JOB_RESULT_TTL)).first()
+    if job is None:
+        return None
+    if job.status in (PENDING, RUNNING) and job.heartbeat < now - timedelta(seconds=settings.LOG_JOB_STALE_AFTER):
+        return {"status": FAILURE, "reason": "Job was interrupted when worker {} stopped".format(job.owner)}
+    if job.status == SUCCESS:
+        return {"status": job.status, "response": job.response}
+    if job.status == FAILURE:
+        return {"status": job.status, "reason": job.reason}
+    return {"status": job.status}
+
+
+def submit(func, *args):
+    """
+        Run func(*args) in the background and return the id to poll its result with
+    """
+    now = timezone.now()
+    LogJob.objects.filter(created__lt=now - timedelta(seconds=settings.LOG_JOB_RESULT_TTL)).delete()
+    job_id = uuid.uuid4().hex
+    LogJob.objects.create(id=job_id, status=PENDING, owner=_owner(), heartbeat=now)
+    with _lock:
+        _active.add(job_id)
+        _start_heartbeat()
+    executor.submit(_run, job_id, func, args)
+    return job_id
+
+
+def _run(job_id, func, args):
+    try:
+        _save(job_id, RUNNING)
+        try:
+            _save(job_id, SUCCESS, response=func(*args))
+        except (FetchError, LogFormatError) as e:
+            _save(job_id, FAILURE, reason=str(e))
+        except Exception:
+            logger.exception("Log processing job %s failed", job_id)
+            _save(job_id, FAILURE, reason="Internal error")
+    finally:
+        with _lock:
+            _active.discard(job_id)
+        connection.close()
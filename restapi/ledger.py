@@ -0,0 +1,48 @@
+from django.db.models import Case, F, Value, When
+
+from restapi.models import GroupBalance
+
+
+def expense_dues(user_expenses):
+    """
+        {user id: amount lent - amount owed} of an expense, from UserExpense rows or validated data
+    """
+    dues = {}
+    for user_expense in user_expenses:
+        if isinstance(user_expense, dict):
+            user_id = user_expense['user'].id
+            due = user_expense['amount_lent'] - user_expense['amount_owed']
+        else:
+            user_id = user_expense.user_id
+            due = user_expense.amount_lent - user_expense.amount_owed
+        dues[user_id] = dues.get(user_id, 0) + due
+    return dues
+
+
+def apply(group_id, dues, sign=1):
+    """
+        Add (sign=1) or take back (sign=-1) an expense's dues on its group's ledger. Must run inside the
+        transaction that writes the expense. Missing balances are inserted ignoring conflicts and every
+        change is an UPDATE amount = amount + due, so concurrent writers to the same balance neither
+        lose an update nor fail on the (group, user) unique constraint.
+    """
+    changes = {user_id: sign * due for user_id, due in dues.items() if due}
+    if group_id is None or not changes:
+        return
+    GroupBalance.objects.bulk_create([GroupBalance(group_id=group_id, user_id=user_id) for user_id in changes],
+                                     ignore_conflicts=True)
+    change = Case(*[When(user_id=user_id, then=Value(amount)) for user_id, amount in changes.items()],
+                  output_field=GroupBalance._meta.get_field('amount'))
+    GroupBalance.objects.filter(group_id=group_id, user_id__in=changes.keys()).update(amount=F('amount') + change)
+
+
+def replace(old_group_id, old_dues, group_id, dues):
+    """
+        Swap an edited expense's old dues for its new ones, touching only the balances that change
+    """
+    if old_group_id != group_id:
+        apply(old_group_id, old_dues, -1)
+        apply(group_id, dues)
+        return
+    changes = {user_id: dues.get(user_id, 0) - old_dues.get(user_id, 0) for user_id in old_dues.keys() | dues.keys()}
+    apply(group_id, {user_id: change for user_id, change in changes.items() if change})
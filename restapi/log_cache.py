@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+LogFile = namedtuple('LogFile', ['etag', 'last_modified', 'data'])
+
+
+class LogCache(object):
+    """
+        Least recently used aggregated bucket counts per log file url, kept with the ETag/Last-Modified
+        validators needed to revalidate them
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url, entry):
+        if entry.etag is None and entry.last_modified is None:
+            # nothing to revalidate with, so the file would have to be fetched again anyway
+            return
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is not None and entry.etag is not None:
+        headers['If-None-Match'] = entry.etag
+    if entry is not None and entry.last_modified is not None:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+log_cache = LogCache(settings.LOG_CACHE_MAX_ENTRIES)
@@ -0,0 +1,186 @@
+import json
+import random
+import resource
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from rest_framework.test import APIClient
+
+from restapi.benchmarks.data import WORDS, create_expenses, create_groups, create_users, synthetic_log
+from restapi.benchmarks.log_server import LogServer
+from restapi.log_cache import log_cache
+from restapi.models import GroupBalance, UserExpense
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, p):
+    # nearest rank
+    ordered = sorted(samples)
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, and the peak of the whole process so far
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_alloc_mb(request):
+    """
+        Peak of the memory Python allocated during one call of request, over what was allocated before it.
+        Unlike ru_maxrss this starts afresh for every scenario.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        request()
+        return (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Time the balance, search and log processing endpoints on a throwaway database filled with synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="UserExpense rows to generate")
+        parser.add_argument('--users', type=int, help="defaults to one user per 50 rows")
+        parser.add_argument('--group-size', type=int, default=20)
+        parser.add_argument('--log-files', type=int, default=30)
+        parser.add_argument('--log-lines', type=int, default=100000, help="lines per log file")
+        parser.add_argument('--parallel', type=int, nargs='+', default=[1, 5, 10, 30],
+                            help="parallelFileProcessingCount values to run /process-logs/ with")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="write the results to this JSON file")
+        parser.add_argument('--baseline', help="compare against results saved earlier with --output")
+        parser.add_argument('--tolerance', type=float, default=1.2,
+                            help="fail when a p95 exceeds the baseline by more than this factor")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        self.stdout.write("peak RSS of the whole run: {:.1f} MB".format(peak_rss_mb()))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        user_ids = create_users(options['users'] or max(10, options['rows'] // 50))
+        groups = create_groups(user_ids, max(1, len(user_ids) // options['group_size']), options['group_size'], rng)
+        rows = create_expenses(options['rows'], user_ids, groups, rng)
+        log_files = [synthetic_log(options['log_lines'], rng) for _ in range(options['log_files'])]
+        self.stderr.write("generated {} users, {} groups, {} expense rows and {} log files in {:.1f}s".format(
+            len(user_ids), len(groups), rows, len(log_files), time.perf_counter() - start))
+
+        # the busiest user and the largest of their groups are the worst cases for the balance endpoints
+        user_id = UserExpense.objects.values('user').annotate(n=Count('id')).order_by('-n')[0]['user']
+        group_id = GroupBalance.objects.filter(group__members=user_id).values('group').annotate(
+            n=Count('group__balances')).order_by('-n')[0]['group']
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(id=user_id))
+
+        def get(url):
+            return lambda: client.get(url)
+
+        scenarios = [
+            ('balances', get('/api/v1/balances/'), True),
+            ('balances cached', get('/api/v1/balances/'), False),
+            ('group balances', get('/api/v1/groups/{}/balances/'.format(group_id)), True),
+            ('expenses', get('/api/v1/expenses/?pagination=cursor'), True),
+            ('expenses search', get('/api/v1/expenses/?q={}'.format(WORDS[0])), True),
+        ]
+        results = {}
+        for name, request, cold in scenarios:
+            results[name] = self.measure(request, options['iterations'], cold)
+
+        with LogServer(log_files) as server:
+            for parallel in options['parallel']:
+                body = {'logFiles': server.urls(), 'parallelFileProcessingCount': parallel}
+                request = lambda: client.post('/api/v1/process-logs/', body, format='json')
+                # every file is fetched and parsed per request, so fewer iterations keep the run short
+                results['process logs x{}'.format(parallel)] = self.measure(
+                    request, max(1, options['iterations'] // 4), True)
+            # unchanged files are revalidated with If-None-Match and served from log_cache
+            results['process logs 304'] = self.measure(request, options['iterations'], False)
+        return results
+
+    def measure(self, request, iterations, cold):
+        """
+            Run request iterations times after one warm-up call. Cold runs clear the response and log caches first
+            so every call does the full work. The allocation peak comes from one more call, as tracing
+            allocations would slow down the timed ones.
+        """
+        request()
+        samples, queries = [], []
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+                log_cache.clear()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = request()
+                samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError("benchmark request failed with {}: {}".format(response.status_code,
+                                                                                response.content[:200]))
+            queries.append(counter.count)
+        result = {'p{}'.format(p): percentile(samples, p) for p in PERCENTILES}
+        result['queries'] = max(queries)
+        if cold:
+            cache.clear()
+            log_cache.clear()
+        result['peak_alloc_mb'] = peak_alloc_mb(request)
+        return result
+
+    def report(self, results):
+        self.stdout.write("{:<22}{:>10}{:>10}{:>10}{:>9}{:>12}".format(
+            'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'alloc MB'))
+        for name, r in results.items():
+            self.stdout.write("{:<22}{:>10.2f}{:>10.2f}{:>10.2f}{:>9}{:>12.1f}".format(
+                name, r['p50'], r['p95'], r['p99'], r['queries'], r['peak_alloc_mb']))
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, r in results.items():
+            if name not in baseline:
+                continue
+            ratio = r['p95'] / baseline[name]['p95'] if baseline[name]['p95'] else 1
+            more_queries = r['queries'] > baseline[name]['queries']
+            self.stdout.write("{:<22} p95 x{:.2f}, queries {} -> {}".format(
+                name, ratio, baseline[name]['queries'], r['queries']))
+            if ratio > tolerance or more_queries:
+                regressions.append(name)
+        if regressions:
+            raise CommandError("regressed against {}: {}".format(path, ', '.join(regressions)))
@@ -0,0 +1,40 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+
+from restapi.settlement import EXACT_LIMIT, greedy, minimum_transfers
+
+
+def random_dues(members, rng):
+    # cents, as the views hand them to the engine
+    amounts = [rng.randint(-100000, 100000) for _ in range(members - 1)]
+    amounts.append(-sum(amounts))
+    return dict(enumerate(amounts))
+
+
+class Command(BaseCommand):
+    help = "Time the settlement engine on random groups of 10 to 10k members"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def time(self, solver, dues, repeat):
+        best, transfers = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            transfers = solver(dues)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(transfers)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        cases = [('greedy', greedy, size) for size in options['sizes']]
+        cases += [('exact', minimum_transfers, size) for size in sorted({min(size, EXACT_LIMIT)
+                                                                         for size in options['sizes']})]
+        self.stdout.write("{:<8}{:>8}{:>12}{:>12}".format('solver', 'members', 'best ms', 'transfers'))
+        for name, solver, size in cases:
+            elapsed, transfers = self.time(solver, random_dues(size, rng), options['repeat'])
+            self.stdout.write("{:<8}{:>8}{:>12.3f}{:>12}".format(name, size, elapsed * 1000, transfers))
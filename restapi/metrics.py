@@ -0,0 +1,185 @@
+import asyncio
+import copy
+import socket
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in labels) + '}'
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values):
+        for key, value in values.items():
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+
+class Histogram(object):
+    """
+        Cumulative-bucket histogram; values holds, per label set, the count in each bucket
+        (plus one for +Inf), the sum and the count of observations
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0, 0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def merge(self, values):
+        for key, (counts, total, count) in values.items():
+            own_counts, own_total, own_count = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0, 0)
+            self.values[key] = ([a + b for a, b in zip(own_counts, counts)], own_total + total, own_count + count)
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', key + (('le', bound),), cumulative
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, count
+
+
+class Registry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def counter(self, name, help):
+        return self.add(Counter(name, help))
+
+    def histogram(self, name, help, buckets):
+        return self.add(Histogram(name, help, buckets))
+
+    def add(self, metric):
+        metric.lock = self.lock
+        self.metrics.append(metric)
+        return metric
+
+    def export(self):
+        with self.lock:
+            return {metric.name: copy.deepcopy(metric.values) for metric in self.metrics}
+
+    def merge(self, exported):
+        # adds what export() returned in another process, e.g. a process-mode log worker
+        with self.lock:
+            for metric in self.metrics:
+                metric.merge(exported.get(metric.name, {}))
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics:
+                metric.values.clear()
+
+    def render(self):
+        """
+            All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.append('# HELP {} {}'.format(metric.name, metric.help))
+                lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+                for name, key, value in metric.samples():
+                    lines.append('{}{} {}'.format(name, _label_text(key), value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+LINES_PER_SECOND_BUCKETS = tuple(10000 * 2 ** i for i in range(10))
+
+# /process-logs/ pipeline. The per-file stages overlap in time, since each file is parsed while it
+# streams in: fetch is time spent waiting on the network, parse and aggregate are CPU time between reads.
+LOG_FETCH_SECONDS = registry.histogram(
+    'logprocessor_fetch_seconds', "Time per log file spent connecting and reading the body", SECONDS_BUCKETS)
+LOG_PARSE_SECONDS = registry.histogram(
+    'logprocessor_parse_seconds', "Time per log file spent parsing lines", SECONDS_BUCKETS)
+LOG_AGGREGATE_SECONDS = registry.histogram(
+    'logprocessor_aggregate_seconds', "Time per log file spent counting parsed lines into buckets", SECONDS_BUCKETS)
+LOG_MERGE_SECONDS = registry.histogram(
+    'logprocessor_merge_seconds', "Time per request spent merging the per-file counts", SECONDS_BUCKETS)
+LOG_FORMAT_SECONDS = registry.histogram(
+    'logprocessor_format_seconds', "Time per request spent building the response", SECONDS_BUCKETS)
+LOG_REQUEST_SECONDS = registry.histogram(
+    'logprocessor_request_seconds', "Time per request through the whole pipeline", SECONDS_BUCKETS)
+LOG_FETCH_BYTES = registry.histogram(
+    'logprocessor_fetch_bytes', "Body size per fetched log file", BYTES_BUCKETS)
+LOG_LINES_PER_SECOND = registry.histogram(
+    'logprocessor_lines_per_second', "Lines per second of parse and aggregate time per log file",
+    LINES_PER_SECOND_BUCKETS)
+LOG_LINES = registry.counter('logprocessor_lines_total', "Log lines parsed")
+LOG_NOT_MODIFIED = registry.counter(
+    'logprocessor_not_modified_total', "Fetches answered 304 and served from the log cache")
+LOG_FETCH_ERRORS = registry.counter(
+    'logprocessor_fetch_errors_total',
+    "Failed fetch attempts, retried or not, by kind: timeout, http, connection or format")
+
+
+def fetch_error_kind(reason):
+    if isinstance(reason, (socket.timeout, asyncio.TimeoutError)):
+        return 'timeout'
+    if isinstance(reason, str) and reason.startswith('HTTP '):
+        return 'http'
+    return 'connection'
+
+
+def timed_iter(iterable, totals, key, size=len):
+    """
+        Yield from iterable, adding the seconds spent producing items to totals[key] and their sizes
+        to totals[key + '_size']. Time inside a wrapped inner iterator is included.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            totals[key] += time.perf_counter() - start
+            return
+        totals[key] += time.perf_counter() - start
+        totals[key + '_size'] += size(item)
+        yield item
+
+
+def record_log_file(fetch, parse, aggregate, size, lines):
+    LOG_FETCH_SECONDS.observe(fetch)
+    LOG_PARSE_SECONDS.observe(parse)
+    LOG_AGGREGATE_SECONDS.observe(aggregate)
+    LOG_FETCH_BYTES.observe(size)
+    LOG_LINES.inc(lines)
+    if parse + aggregate > 0:
+        LOG_LINES_PER_SECOND.observe(lines / (parse + aggregate))
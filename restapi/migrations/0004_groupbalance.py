@@ -0,0 +1,44 @@
+# Generated by Django 3.1.6 on 2026-10-17 17:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_group_balances(apps, _schema_editor):
+    UserExpense = apps.get_model('restapi', 'UserExpense')
+    GroupBalance = apps.get_model('restapi', 'GroupBalance')
+    balances = {}
+    rows = UserExpense.objects.filter(expense__group__isnull=False)\
+        .values_list('expense__group_id', 'user_id', 'amount_lent', 'amount_owed')
+    for group_id, user_id, amount_lent, amount_owed in rows.iterator():
+        balances[(group_id, user_id)] = balances.get((group_id, user_id), 0) + amount_lent - amount_owed
+    GroupBalance.objects.bulk_create(
+        [GroupBalance(group_id=group_id, user_id=user_id, amount=amount)
+         for (group_id, user_id), amount in balances.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('restapi', '0003_auto_20210807_1121'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='restapi.groups')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_group_balances, migrations.RunPython.noop),
+    ]
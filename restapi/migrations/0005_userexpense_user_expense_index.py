@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restapi', '0004_groupbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userexpense',
+            index=models.Index(fields=['user', 'expense'], name='restapi_use_user_id_32e18b_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+import sqlite3
+
+from django.db import migrations
+
+# restapi.search.SEARCH_FIELDS and fts_table() as they were when this migration was written, frozen here
+# so that later changes to the search module cannot change what it creates or drops
+SEARCH_FIELDS = {
+    'restapi_expenses': 'description',
+    'restapi_groups': 'name',
+}
+
+
+def fts_table(db_table):
+    return '{}_fts'.format(db_table)
+
+
+def _supports_trigram_fts(connection):
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_indexes(_apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and _supports_trigram_fts(connection):
+        for table, column in SEARCH_FIELDS.items():
+            fts = fts_table(table)
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', content_rowid='id', "
+                "tokenize='trigram')".format(fts=fts, table=table, column=column))
+            schema_editor.execute(
+                "CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END".format(
+                    fts=fts, table=table, column=column))
+            schema_editor.execute(
+                "CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                "INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END".format(
+                    fts=fts, table=table, column=column))
+            schema_editor.execute(
+                "CREATE TRIGGER {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+                "INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+                "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END".format(
+                    fts=fts, table=table, column=column))
+            schema_editor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=fts))
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, column in SEARCH_FIELDS.items():
+            # icontains compiles to UPPER(column) LIKE UPPER(%s), which this index serves
+            schema_editor.execute(
+                'CREATE INDEX {fts}_trgm ON {table} USING gin (UPPER("{column}"::text) gin_trgm_ops)'.format(
+                    fts=fts_table(table), table=table, column=column))
+
+
+def drop_search_indexes(_apps, schema_editor):
+    connection = schema_editor.connection
+    for table in SEARCH_FIELDS:
+        fts = fts_table(table)
+        if connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute("DROP TRIGGER IF EXISTS {}_{}".format(fts, suffix))
+            schema_editor.execute("DROP TABLE IF EXISTS {}".format(fts))
+        elif connection.vendor == 'postgresql':
+            schema_editor.execute("DROP INDEX IF EXISTS {}_trgm".format(fts))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restapi', '0005_userexpense_user_expense_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
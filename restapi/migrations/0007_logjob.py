@@ -0,0 +1,25 @@
+# Generated by Django 3.1.6 on 2026-10-17 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restapi', '0006_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogJob',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=16)),
+                ('response', models.JSONField(null=True)),
+                ('reason', models.TextField(blank=True)),
+                ('owner', models.CharField(max_length=100)),
+                ('heartbeat', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -29,5 +29,34 @@ class UserExpense(models.Model):
     amount_owed = models.DecimalField(max_digits=10, decimal_places=2)
     amount_lent = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta(object):
+        indexes = [models.Index(fields=['user', 'expense'])]
+
     def __str__(self):
         return f"user: {self.user}, amount_owed: {self.amount_owed} amount_lent: {self.amount_lent}"
+
+
+class GroupBalance(models.Model):
+    """
+        Net amount lent - owed of a user over all expenses of a group, kept current by restapi.ledger
+    """
+    group = models.ForeignKey(Groups, on_delete=models.CASCADE, related_name='balances')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_balances')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta(object):
+        unique_together = ('group', 'user')
+
+
+class LogJob(models.Model):
+    """
+        A /process-logs/jobs/ run, see restapi.jobs. owner is the host:pid running it, which refreshes
+        heartbeat until the job finishes.
+    """
+    id = models.CharField(max_length=32, primary_key=True)
+    status = models.CharField(max_length=16)
+    response = models.JSONField(null=True)
+    reason = models.TextField(blank=True)
+    owner = models.CharField(max_length=100)
+    heartbeat = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,15 @@
+from decimal import Decimal
+
+CENTS = 100
+
+
+def to_cents(amount):
+    """
+        Exact integer minor units of a two-decimal amount, converted once where it leaves the database
+    """
+    return int((Decimal(amount) * CENTS).to_integral_value())
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return '{}{}.{:02d}'.format(sign, abs(cents) // CENTS, abs(cents) % CENTS)
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+        Pages keyed on id, so every page is a range scan on the primary key no matter how deep it is.
+        The total count is still returned unless the client passes count=false.
+    """
+    ordering = 'id'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = OrderedDict([('count', self.count)] + list(response.data.items()))
+        return response
+
+
+class KeysetOrOffsetPagination(BasePagination):
+    """
+        LimitOffsetPagination by default, KeysetPagination when the client asks for pagination=cursor
+    """
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            self.paginator = KeysetPagination()
+        else:
+            self.paginator = LimitOffsetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return LimitOffsetPagination().get_schema_operation_parameters(view)
@@ -0,0 +1,24 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+        Newline delimited JSON. Returns a generator reading one line of the stream at a time; a line that
+        is not valid JSON comes out as a ParseError instance instead of failing the whole body.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return (_parse_line(line, encoding) for line in iter(stream.readline, b'') if line.strip())
+
+
+def _parse_line(line, encoding):
+    try:
+        return json.loads(line.decode(encoding))
+    except ValueError as e:
+        return ParseError('JSON parse error - %s' % str(e))
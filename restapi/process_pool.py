@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+# kept free of model imports: spawned workers import this module before Django is set up
+_pool = None
+_lock = threading.Lock()
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def process_pool():
+    """
+        The worker processes shared by every parsingMode=process request, LOG_PROCESS_WORKERS of them at
+        most. They are spawned rather than forked, since the server process runs threads whose locks a
+        fork would copy in whatever state they are in.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.LOG_PROCESS_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker,
+                                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),))
+        return _pool
+
+
+def discard_process_pool(executor):
+    """
+        Drop a broken pool so that the next request starts a new one
+    """
+    global _pool
+    with _lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False)
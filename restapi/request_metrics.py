@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics(object):
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+        self.db_ms = 0.0
+        self._depth = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - start) * 1000
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+        connection_created receiver. The recorder stays on the connection and finds the request through a
+        context variable, which follows a request into the thread Django runs sync views in under ASGI.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def stage(name):
+    """
+        Add the time spent in the block to the current request's name stage. Nested blocks of the same
+        stage, like a serializer inside a serializer, are only counted once.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._depth[name]:
+        yield
+        return
+    metrics._depth[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._depth[name] -= 1
+        metrics.stages[name] = metrics.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+class SamplingProfiler(threading.Thread):
+    """
+        Samples the stack of one thread every interval seconds into folded "frame;frame;frame count" form,
+        the input flamegraph.pl and speedscope read
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(frame.f_globals.get('__name__', code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+def server_timing(metrics, total_ms, peak_bytes):
+    entries = ['db;dur={:.2f};desc="{} queries"'.format(metrics.db_ms, metrics.queries)]
+    entries += ['{};dur={:.2f}'.format(name, ms) for name, ms in metrics.stages.items()]
+    if peak_bytes is not None:
+        entries.append('alloc;desc="peak {:.1f} KiB"'.format(peak_bytes / 1024))
+    entries.append('total;dur={:.2f}'.format(total_ms))
+    return ', '.join(entries)
+
+
+class RequestMetricsMiddleware(object):
+    """
+        Times each request and reports wall time, DB query count and time, named stages (see stage()) and,
+        with REQUEST_METRICS_TRACE_ALLOCATIONS, the allocation peak in a Server-Timing header and a
+        structured log record. Requests slower than REQUEST_PROFILE_THRESHOLD_MS get their sampled stacks
+        written to REQUEST_PROFILE_DIR. Works in both sync and async stacks, so under ASGI it does not push
+        async views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function for Django's middleware adaptation
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self.trace_allocations = getattr(settings, 'REQUEST_METRICS_TRACE_ALLOCATIONS', False)
+        self.profile_threshold = getattr(settings, 'REQUEST_PROFILE_THRESHOLD_MS', None)
+        self.profile_interval = getattr(settings, 'REQUEST_PROFILE_INTERVAL_MS', 5) / 1000
+        self.profile_dir = getattr(settings, 'REQUEST_PROFILE_DIR', 'profiles')
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics, token, profiler, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            total_ms = self.stop(token, profiler, start)
+        return self.finish(request, response, metrics, profiler, total_ms)
+
+    async def __acall__(self, request):
+        metrics, token, profiler, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total_ms = self.stop(token, profiler, start)
+        return self.finish(request, response, metrics, profiler, total_ms)
+
+    def start(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = None
+        if self.profile_threshold is not None:
+            # on the event loop this samples the loop thread, so the profile includes other requests
+            profiler = SamplingProfiler(threading.get_ident(), self.profile_interval)
+            profiler.start()
+        if self.trace_allocations:
+            # the peak is process wide, so with threaded workers it includes concurrent requests
+            tracemalloc.reset_peak()
+        return metrics, token, profiler, time.perf_counter()
+
+    def stop(self, token, profiler, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        _current.reset(token)
+        if profiler is not None:
+            profiler.stop()
+        return total_ms
+
+    def finish(self, request, response, metrics, profiler, total_ms):
+        peak_bytes = tracemalloc.get_traced_memory()[1] if self.trace_allocations else None
+
+        response['Server-Timing'] = server_timing(metrics, total_ms, peak_bytes)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_queries': metrics.queries,
+            'db_ms': round(metrics.db_ms, 2),
+            'stages': {name: round(ms, 2) for name, ms in metrics.stages.items()},
+            'alloc_peak_bytes': peak_bytes,
+        }
+        if profiler is not None and total_ms >= self.profile_threshold and profiler.samples:
+            record['profile'] = self.dump_profile(profiler, request)
+        logger.info(json.dumps(record), extra={'request_metrics': record})
+        return response
+
+    def dump_profile(self, profiler, request):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = '{}-{}-{}.folded'.format(time.time_ns() // 1000, request.method,
+                                        re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_'))
+        path = os.path.join(self.profile_dir, name)
+        profiler.dump(path)
+        return path
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def user_scope(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def group_scope(group_id):
+    return 'group:{}'.format(group_id)
+
+
+CATEGORIES_SCOPE = 'categories'
+
+
+def _version_key(scope):
+    return 'response-version:{}'.format(scope)
+
+
+def _new_version():
+    # never reuse a number a lost version key may already have had
+    return time.time_ns()
+
+
+def versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), _new_version(), None)
+
+
+def invalidate(scopes):
+    """
+        Retire every response cached under scopes once the current transaction commits
+    """
+    scopes = list(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def expense_scopes(group_id, user_ids):
+    scopes = [user_scope(user_id) for user_id in user_ids]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return any(tag.strip().replace('W/', '', 1) in (etag, '*') for tag in header.split(',') if tag.strip())
+
+
+def cached_response(request, key, scopes, compute):
+    """
+        Response with compute()'s data, cached until one of the scopes it depends on is invalidated.
+        The ETag is derived from the scope versions, so a client that already has the current body gets a
+        304 without the data being computed or even read from the cache.
+    """
+    key = '{}:{}'.format(key, ':'.join(str(version) for version in versions(scopes)))
+    etag = '"{}"'.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+    if _etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    data = cache.get('response:' + key)
+    if data is None:
+        data = compute()
+        cache.set('response:' + key, data, settings.RESPONSE_CACHE_TTL)
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
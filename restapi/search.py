@@ -0,0 +1,47 @@
+from django.db import connections
+
+# Searchable model field -> full-text table maintained by migration 0006_search_indexes, which keeps its own
+# copy of this map; a field added here needs a migration of its own
+SEARCH_FIELDS = {
+    'restapi_expenses': 'description',
+    'restapi_groups': 'name',
+}
+# The trigram tokenizer cannot match anything shorter than one trigram
+MIN_QUERY_LENGTH = 3
+
+_fts_tables = {}
+
+
+def fts_table(db_table):
+    return '{}_fts'.format(db_table)
+
+
+def _has_fts_table(connection, db_table):
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_tables:
+        _fts_tables[key] = set(connection.introspection.table_names())
+    return fts_table(db_table) in _fts_tables[key]
+
+
+def search(queryset, field, q):
+    """
+        Filter queryset to the rows whose field contains q, case-insensitively, best matches first.
+        Uses the FTS5 trigram index on SQLite and the pg_trgm index on PostgreSQL, and falls back to a
+        plain icontains scan elsewhere or for queries too short to be indexed.
+    """
+    connection = connections[queryset.db]
+    db_table = queryset.model._meta.db_table
+    if connection.vendor == 'sqlite' and len(q) >= MIN_QUERY_LENGTH and _has_fts_table(connection, db_table):
+        table = fts_table(db_table)
+        phrase = '"{}"'.format(q.replace('"', '""'))
+        return queryset.extra(
+            select={'search_rank': '{}.rank'.format(table)},
+            tables=[table],
+            where=['{0}.rowid = {1}.id'.format(table, db_table), '{} MATCH %s'.format(table)],
+            params=[phrase],
+        ).order_by('search_rank', 'id')
+    queryset = queryset.filter(**{'{}__icontains'.format(field): q})
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        return queryset.annotate(search_rank=TrigramSimilarity(field, q)).order_by('-search_rank', 'id')
+    return queryset
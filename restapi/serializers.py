@@ -1,11 +1,47 @@
-from rest_framework.serializers import ModelSerializer
+from django.db import transaction
+from rest_framework.serializers import ModelSerializer, PrimaryKeyRelatedField
 from rest_framework.serializers import ValidationError
 from django.contrib.auth.models import User
 
+from restapi import ledger, request_metrics
 from restapi.models import Category, Groups, UserExpense, Expenses
+from restapi.response_cache import expense_scopes, invalidate
 
 
-class UserSerializer(ModelSerializer):
+class PrefetchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+        Resolves pks from context['related_objects'] ({model: {pk: instance}}) when the caller loaded them
+        up front, so validating many rows does not cost one query per relation per row
+    """
+
+    def to_internal_value(self, data):
+        objects = self.context.get('related_objects', {}).get(self.get_queryset().model)
+        if objects is None:
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+
+class TimedModelSerializer(ModelSerializer):
+    """
+        Reports validation and representation time as the request's serializer stage
+    """
+
+    def run_validation(self, *args, **kwargs):
+        with request_metrics.stage('serializer'):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, instance):
+        with request_metrics.stage('serializer'):
+            return super().to_representation(instance)
+
+
+class UserSerializer(TimedModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         return user
@@ -18,13 +54,13 @@ class UserSerializer(ModelSerializer):
         }
 
 
-class CategorySerializer(ModelSerializer):
+class CategorySerializer(TimedModelSerializer):
     class Meta(object):
         model = Category
         fields = '__all__'
 
 
-class GroupSerializer(ModelSerializer):
+class GroupSerializer(TimedModelSerializer):
     members = UserSerializer(many=True, required=False)
 
     class Meta(object):
@@ -32,42 +68,67 @@ class GroupSerializer(ModelSerializer):
         fields = '__all__'
 
 
-class UserExpenseSerializer(ModelSerializer):
+class UserExpenseSerializer(TimedModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta(object):
         model = UserExpense
         fields = ['user', 'amount_owed', 'amount_lent']
 
 
-class ExpensesSerializer(ModelSerializer):
+class ExpensesSerializer(TimedModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
     users = UserExpenseSerializer(many=True, required=True)
 
+    @transaction.atomic
     def create(self, validated_data):
         expense_users = validated_data.pop('users')
         expense = Expenses.objects.create(**validated_data)
         for eu in expense_users:
             UserExpense.objects.create(expense=expense, **eu)
+        dues = ledger.expense_dues(expense_users)
+        ledger.apply(expense.group_id, dues)
+        invalidate(expense_scopes(expense.group_id, dues.keys()))
         return expense
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         user_expenses = validated_data.pop('users')
+        existing = {user_expense.user_id: user_expense for user_expense in instance.users.all()}
+        old_group_id = instance.group_id
+        old_dues = ledger.expense_dues(existing.values())
         instance.description = validated_data['description']
         instance.category = validated_data['category']
         instance.group = validated_data.get('group', None)
         instance.total_amount = validated_data['total_amount']
 
-        if user_expenses:
-            instance.users.all().delete()
-            UserExpense.objects.bulk_create(
-                [
-                    user_expense(expense=instance, **user_expense)
-                    for user_expense in user_expenses
-                ],
-            )
+        # users is the full new list of participants; only those added, changed or dropped are written
+        incoming = {user_expense['user'].id: user_expense for user_expense in user_expenses}
+        changed = []
+        for user_id, row in existing.items():
+            user_expense = incoming.get(user_id)
+            if user_expense is not None and (row.amount_owed, row.amount_lent) != \
+                    (user_expense['amount_owed'], user_expense['amount_lent']):
+                row.amount_owed = user_expense['amount_owed']
+                row.amount_lent = user_expense['amount_lent']
+                changed.append(row)
+        UserExpense.objects.bulk_update(changed, ['amount_owed', 'amount_lent'])
+        UserExpense.objects.bulk_create([UserExpense(expense=instance, **user_expense)
+                                         for user_id, user_expense in incoming.items() if user_id not in existing])
+        removed = existing.keys() - incoming.keys()
+        if removed:
+            instance.users.filter(user_id__in=removed).delete()
+        dues = ledger.expense_dues(user_expenses)
         instance.save()
+        ledger.replace(old_group_id, old_dues, instance.group_id, dues)
+        invalidate(expense_scopes(old_group_id, old_dues.keys()))
+        invalidate(expense_scopes(instance.group_id, dues.keys()))
         return instance
 
     def validate(self, attrs):
         # user = self.context['request'].user
+        if not attrs['users']:
+            raise ValidationError('An expense needs at least one participant')
         user_ids = [user['user'].id for user in attrs['users']]
         if len(set(user_ids)) != len(user_ids):
             raise ValidationError('Single user appears multiple times')
@@ -84,16 +145,17 @@ class ExpensesSerializer(ModelSerializer):
         #     if user.id not in user_ids:
         #         raise ValidationError('For non-group expenses, user should be part of expense')
 
-        # total_amount = data['total_amount']
-        # amount_owed = 0
-        # amount_lent = 0
-        # for user in data['users']:
-        #     if user['amount_owed'] < 0 or user['amount_lent'] < 0 or total_amount < 0:
-        #         raise ValidationError('Expense amounts must be positive')
-        #     amount_owed += user['amount_owed']
-        #     amount_lent += user['amount_lent']
-        # if amount_lent != amount_owed or amount_lent != total_amount:
-        #     raise ValidationError('Given amounts are inconsistent')
+        # the dues of an expense must sum to zero for the ledger and the settlement to balance
+        total_amount = attrs['total_amount']
+        amount_owed = 0
+        amount_lent = 0
+        for user in attrs['users']:
+            if user['amount_owed'] < 0 or user['amount_lent'] < 0 or total_amount < 0:
+                raise ValidationError('Expense amounts must be positive')
+            amount_owed += user['amount_owed']
+            amount_lent += user['amount_lent']
+        if amount_lent != amount_owed or amount_lent != total_amount:
+            raise ValidationError('Given amounts are inconsistent')
 
         return attrs
 
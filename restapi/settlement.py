@@ -0,0 +1,91 @@
+"""
+    Debt settlement: turn {user: net amount} dues (positive = is owed money) into a list of
+    (from_user, to_user, amount) transfers that clears them. Every amount is positive. Dues should sum to
+    zero; when they do not, the transfers clear the side that is owed or owes less and leave the surplus
+    of the other side unsettled.
+"""
+
+# Above this many non-zero dues the exact solver's 2^n table gets too large and settle() goes greedy
+EXACT_LIMIT = 12
+
+
+def _nonzero(dues):
+    return [(user, amount) for user, amount in dues.items() if amount != 0]
+
+
+# Stands in for the money missing from dues that do not sum to zero, so that the exact solver always
+# works on a balanced set. Transfers to or from it are dropped.
+_SURPLUS = object()
+
+
+def greedy(dues):
+    """
+        Repeatedly settle the largest debtor against the largest creditor. Linear after the sort and at
+        most one transfer fewer than there are non-zero dues, but not always the fewest possible.
+    """
+    dues = sorted(_nonzero(dues), key=lambda item: item[1])
+    start = 0
+    end = len(dues) - 1
+    transfers = []
+    while start < end and dues[start][1] < 0 < dues[end][1]:
+        amount = min(-dues[start][1], dues[end][1])
+        transfers.append((dues[start][0], dues[end][0], amount))
+        dues[start] = (dues[start][0], dues[start][1] + amount)
+        dues[end] = (dues[end][0], dues[end][1] - amount)
+        if dues[start][1] == 0:
+            start += 1
+        if dues[end][1] == 0:
+            end -= 1
+    return transfers
+
+
+def minimum_transfers(dues):
+    """
+        The fewest transfers possible. Splitting n dues into k groups that each sum to zero allows n - k
+        transfers, so this finds the partition with the most zero-sum groups by dynamic programming over
+        subsets, then settles each group greedily. O(2^n * n) for n non-zero dues.
+    """
+    items = _nonzero(dues)
+    surplus = sum(amount for _, amount in items)
+    if surplus:
+        items.append((_SURPLUS, -surplus))
+    n = len(items)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + items[low.bit_length() - 1][1]
+    # groups[mask]: most zero-sum groups the dues in mask can be cut into, removing one due at a time
+    groups = [0] * (full + 1)
+    removed = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        best, best_bit = -1, 0
+        bits = mask
+        while bits:
+            bit = bits & -bits
+            if groups[mask ^ bit] > best:
+                best, best_bit = groups[mask ^ bit], bit
+            bits ^= bit
+        groups[mask] = best + (1 if sums[mask] == 0 else 0)
+        removed[mask] = best_bit
+
+    transfers = []
+    mask, group = full, {}
+    while mask:
+        bit = removed[mask]
+        user, amount = items[bit.bit_length() - 1]
+        group[user] = amount
+        mask ^= bit
+        if sums[mask] == 0:
+            transfers.extend(greedy(group))
+            group = {}
+    return [transfer for transfer in transfers if _SURPLUS not in transfer[:2]]
+
+
+def settle(dues, exact_limit=EXACT_LIMIT):
+    """
+        Fewest transfers for small sets of dues, the greedy fast path for larger ones
+    """
+    if len(_nonzero(dues)) <= exact_limit:
+        return minimum_transfers(dues)
+    return greedy(dues)
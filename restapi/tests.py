@@ -1,6 +1,552 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-# from django.test import TestCase
+import json
+import random
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from restapi import jobs
+from restapi.authentication import token_cache
+from restapi.benchmarks.log_server import LogServer
+from restapi.bulk_import import import_expenses
+from restapi.custom_exception import LogFormatError
+from restapi.models import Category, Groups, Expenses, GroupBalance, LogJob, UserExpense
+from restapi.log_cache import log_cache
+from restapi.settlement import EXACT_LIMIT, greedy, minimum_transfers
+from restapi.views import BUCKET_MS, BUCKETS_PER_DAY, READ_CHUNK_SIZE, aggregate, transform
+
+
+class ListQueryCountTest(APITestCase):
+    """
+        The number of queries of a list endpoint must not grow with the number of rows it returns
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret')
+        friends = [User.objects.create_user(username='friend{}'.format(i), password='secret') for i in range(3)]
+        category = Category.objects.create(name='food')
+        self.group = None
+        for i in range(6):
+            group = Groups.objects.create(name='group{}'.format(i))
+            group.members.add(self.user, *friends)
+            self.group = self.group or group
+        for i in range(6):
+            expense = Expenses.objects.create(description='dinner{}'.format(i), total_amount=40, group=self.group,
+                                              category=category)
+            for user in [self.user] + friends:
+                UserExpense.objects.create(expense=expense, user=user, amount_owed=10,
+                                           amount_lent=40 if user == self.user else 0)
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        # measure the work behind the response, not a response cache hit
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url_template, small, large):
+        # the first request fills per-process caches, such as the search index lookup
+        self.client.get(url_template.format(small))
+        self.assertEqual(self.count_queries(url_template.format(small)), self.count_queries(url_template.format(large)))
+
+    def test_expenses(self):
+        self.assertConstantQueries('/api/v1/expenses/?limit={}', 1, 6)
+
+    def test_expenses_cursor(self):
+        self.assertConstantQueries('/api/v1/expenses/?pagination=cursor&limit={}', 1, 6)
+
+    def test_expenses_search(self):
+        self.assertConstantQueries('/api/v1/expenses/?q=dinner&limit={}', 1, 6)
+
+    def test_groups(self):
+        self.assertConstantQueries('/api/v1/groups/?limit={}', 1, 6)
+
+    def test_expenses_cursor_walk(self):
+        body = self.client.get('/api/v1/expenses/?pagination=cursor&limit=4').json()
+        self.assertEqual(body['count'], 6)
+        ids = [expense['id'] for expense in body['results']]
+        while body['next'] is not None:
+            body = self.client.get(body['next']).json()
+            ids.extend(expense['id'] for expense in body['results'])
+        self.assertEqual(ids, list(Expenses.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_expenses_cursor_without_count(self):
+        for count, expected in (('true', True), ('false', False)):
+            with CaptureQueriesContext(connection) as queries:
+                body = self.client.get('/api/v1/expenses/?pagination=cursor&limit=2&count={}'.format(count)).json()
+            self.assertEqual('count' in body, expected)
+            self.assertEqual(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries), expected)
+            self.assertEqual(len(body['results']), 2)
+
+    def test_group_expenses(self):
+        url = '/api/v1/groups/{}/expenses/'.format(self.group.id)
+        many = self.count_queries(url)
+        Expenses.objects.filter(id__in=Expenses.objects.order_by('id').values_list('id', flat=True)[:5]).delete()
+        self.assertEqual(self.count_queries(url), many)
+
+
+class LedgerTest(APITestCase):
+    """
+        GroupBalance must match a recomputation from UserExpense after every write to an expense
+    """
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username='user{}'.format(i), password='secret') for i in range(3)]
+        self.category = Category.objects.create(name='food')
+        self.groups = [Groups.objects.create(name='group{}'.format(i)) for i in range(2)]
+        for group in self.groups:
+            group.members.add(*self.users)
+        self.client.force_authenticate(self.users[0])
+        # an expense the edits below must leave alone
+        self.write('post', '/api/v1/expenses/', self.groups[0], [(0, 0, 30), (1, 30, 0)])
+
+    def write(self, method, url, group, shares):
+        payload = {"description": "dinner", "category": self.category.id, "group": group and group.id,
+                   "total_amount": str(sum(owed for _, owed, _ in shares)),
+                   "users": [{"user": self.users[user].id, "amount_owed": str(owed), "amount_lent": str(lent)}
+                             for user, owed, lent in shares]}
+        response = getattr(self.client, method)(url, payload, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        self.assertLedgerConsistent()
+        return response
+
+    def assertLedgerConsistent(self):
+        expected = {}
+        for group_id, user_id, lent, owed in UserExpense.objects.filter(expense__group__isnull=False)\
+                .values_list('expense__group_id', 'user_id', 'amount_lent', 'amount_owed'):
+            expected[group_id, user_id] = expected.get((group_id, user_id), 0) + lent - owed
+        actual = {(group_id, user_id): amount for group_id, user_id, amount
+                  in GroupBalance.objects.values_list('group_id', 'user_id', 'amount')}
+        self.assertEqual({key: amount for key, amount in actual.items() if amount},
+                         {key: amount for key, amount in expected.items() if amount})
+
+    def test_expense_lifecycle(self):
+        expense_id = self.write('post', '/api/v1/expenses/', self.groups[0], [(0, 30, 90), (1, 30, 0), (2, 30, 0)])\
+            .json()['id']
+        url = '/api/v1/expenses/{}/'.format(expense_id)
+        # same group, one share changed and one participant dropped
+        self.write('put', url, self.groups[0], [(0, 45, 90), (1, 45, 0)])
+        # same group, a participant added back
+        self.write('put', url, self.groups[0], [(0, 30, 60), (1, 30, 0), (2, 30, 30)])
+        self.write('put', url, self.groups[1], [(0, 30, 60), (1, 30, 0), (2, 30, 30)])
+        self.write('put', url, None, [(0, 30, 60), (1, 30, 0), (2, 30, 30)])
+        self.write('put', url, self.groups[1], [(0, 50, 0), (2, 50, 100)])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertLedgerConsistent()
+        self.assertFalse(UserExpense.objects.filter(expense_id=expense_id).exists())
+
+    def test_no_participants(self):
+        expense_id = self.write('post', '/api/v1/expenses/', self.groups[0], [(0, 10, 20), (1, 10, 0)]).json()['id']
+        response = self.client.put('/api/v1/expenses/{}/'.format(expense_id), {
+            "description": "dinner", "category": self.category.id, "group": self.groups[0].id,
+            "total_amount": "0", "users": []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserExpense.objects.filter(expense_id=expense_id).count(), 2)
+        self.assertEqual(Expenses.objects.get(id=expense_id).total_amount, 20)
+        self.assertLedgerConsistent()
+
+
+class ResponseCacheTest(APITransactionTestCase):
+    """
+        Cached responses must be retired by the writes they depend on, and only the current ETag may get a 304
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username='user{}'.format(i), password='secret') for i in range(3)]
+        self.category = Category.objects.create(name='food')
+        self.group = Groups.objects.create(name='flat')
+        self.group.members.add(*self.users[:2])
+        self.client.force_authenticate(self.users[0])
+        self.group_url = '/api/v1/groups/{}/balances/'.format(self.group.id)
+
+    def write(self, method, url, owed):
+        payload = {"description": "dinner", "category": self.category.id, "group": self.group.id,
+                   "total_amount": str(owed * 2), "users": [
+                       {"user": self.users[0].id, "amount_owed": str(owed), "amount_lent": str(owed * 2)},
+                       {"user": self.users[1].id, "amount_owed": str(owed), "amount_lent": "0"}]}
+        response = getattr(self.client, method)(url, payload, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def assertBalances(self, amount):
+        self.assertEqual(self.client.get(self.group_url).json(), [
+            {"from_user": self.users[1].id, "to_user": self.users[0].id, "amount": amount}] if amount else [])
+        self.assertEqual(self.client.get('/api/v1/balances/').json(),
+                         [{"user": self.users[1].id, "amount": amount}] if amount else [])
+
+    def test_expense_writes(self):
+        self.assertBalances(None)
+        expense_id = self.write('post', '/api/v1/expenses/', 10).json()['id']
+        self.assertBalances('10.00')
+        self.write('put', '/api/v1/expenses/{}/'.format(expense_id), 25)
+        self.assertBalances('25.00')
+        self.assertEqual(self.client.delete('/api/v1/expenses/{}/'.format(expense_id)).status_code, 204)
+        self.assertBalances(None)
+
+    def test_etag(self):
+        etag = self.client.get(self.group_url)['ETag']
+        self.assertEqual(self.client.get(self.group_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.write('post', '/api/v1/expenses/', 10)
+        response = self.client.get(self.group_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.group_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_members(self):
+        etags = [self.client.get(url)['ETag'] for url in
+                 (self.group_url, '/api/v1/groups/{}/expenses/'.format(self.group.id))]
+        response = self.client.put('/api/v1/groups/{}/members/'.format(self.group.id),
+                                   {"add": {"user_ids": [self.users[2].id]}}, format='json')
+        self.assertEqual(response.status_code, 204)
+        for url, etag in zip((self.group_url, '/api/v1/groups/{}/expenses/'.format(self.group.id)), etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_category_create(self):
+        names = [category['name'] for category in self.client.get('/api/v1/categories/').json()['results']]
+        self.assertEqual(names, ['food'])
+        self.assertEqual(self.client.post('/api/v1/categories/', {"name": "travel"}, format='json').status_code, 201)
+        names = [category['name'] for category in self.client.get('/api/v1/categories/').json()['results']]
+        self.assertEqual(names, ['food', 'travel'])
+
+
+class SearchTest(APITestCase):
+    """
+        ?q= must return the rows containing q, ignoring case, through FTS5 or the icontains fallback
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret')
+        category = Category.objects.create(name='food')
+        self.expenses = {}
+        for description in ["Dinner at Luigi's", 'Weekly GROCERIES', 'the "best" pizza', 'taxi', 'dinner rolls']:
+            expense = Expenses.objects.create(description=description, total_amount=10, category=category)
+            UserExpense.objects.create(expense=expense, user=self.user, amount_owed=10, amount_lent=10)
+            self.expenses[description] = expense.id
+        other = Expenses.objects.create(description='dinner for someone else', total_amount=10, category=category)
+        UserExpense.objects.create(expense=other, user=User.objects.create_user(username='other'), amount_owed=10,
+                                   amount_lent=10)
+        self.client.force_authenticate(self.user)
+
+    def search(self, q):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/expenses/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        matched = any('MATCH' in query['sql'] for query in queries.captured_queries)
+        return {expense['description'] for expense in response.json()['results']}, matched
+
+    def test_full_text(self):
+        self.assertEqual(self.search('DINNER'), ({"Dinner at Luigi's", 'dinner rolls'}, True))
+        self.assertEqual(self.search('rocer'), ({'Weekly GROCERIES'}, True))
+        self.assertEqual(self.search('nothing like it'), (set(), True))
+
+    def test_short_query(self):
+        self.assertEqual(self.search('XI'), ({'taxi'}, False))
+        self.assertEqual(self.search('lu'), ({"Dinner at Luigi's"}, False))
+
+    def test_quotes(self):
+        self.assertEqual(self.search('"best"'), ({'the "best" pizza'}, True))
+        self.assertEqual(self.search('Luigi\'s'), ({"Dinner at Luigi's"}, True))
+        self.assertEqual(self.search('st" p'), ({'the "best" pizza'}, True))
+        self.assertEqual(self.search('"'), ({'the "best" pizza'}, False))
+
+
+class BulkImportTest(APITestCase):
+    """
+        /expenses/bulk/ takes a JSON array or NDJSON, imports the valid rows with their ledger changes,
+        reports the others by row number and rejects any other body with a 400
+    """
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username='user{}'.format(i), password='secret') for i in range(3)]
+        self.category = Category.objects.create(name='food')
+        self.group = Groups.objects.create(name='flat')
+        self.group.members.add(*self.users)
+        self.client.force_authenticate(self.users[0])
+
+    def row(self, payer=0, total=30):
+        # the payer lends the total, which everyone owes a third of
+        share = total / 3
+        return {"description": "dinner", "category": self.category.id, "group": self.group.id,
+                "total_amount": str(total), "users": [
+                    {"user": user.id, "amount_owed": str(share), "amount_lent": str(total if i == payer else 0)}
+                    for i, user in enumerate(self.users)]}
+
+    def bad_row(self):
+        row = self.row()
+        row['total_amount'] = '99'
+        return row
+
+    def assertBalances(self, *amounts):
+        balances = dict(GroupBalance.objects.filter(group=self.group).exclude(amount=0)
+                        .values_list('user_id', 'amount'))
+        self.assertEqual(balances, {user.id: amount for user, amount in zip(self.users, amounts) if amount})
+
+    def test_json(self):
+        response = self.client.post('/api/v1/expenses/bulk/', [self.row(), self.bad_row(), self.row(1)],
+                                    format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1])
+        self.assertEqual(Expenses.objects.count(), 2)
+        self.assertBalances(10, 10, -20)
+
+    def test_ndjson(self):
+        lines = [json.dumps(self.row()), '{"description": ', json.dumps(self.row(2, 60))]
+        response = self.client.post('/api/v1/expenses/bulk/', '\n'.join(lines) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 2)
+        [error] = response.json()['errors']
+        self.assertEqual(error['row'], 1)
+        self.assertIn('JSON parse error', error['errors'][0])
+        self.assertBalances(0, -30, 30)
+
+    def test_all_valid(self):
+        response = self.client.post('/api/v1/expenses/bulk/', [self.row(), self.row()], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"created": 2, "errors": []})
+        self.assertBalances(40, -20, -20)
+
+    def test_chunks(self):
+        rows = [self.row(), self.row(), self.bad_row(), self.row(1), 5, self.row(2)]
+        created, errors = import_expenses(rows, chunk_size=2)
+        self.assertEqual(created, 4)
+        self.assertEqual([error['row'] for error in errors], [2, 4])
+        self.assertEqual(UserExpense.objects.count(), 12)
+        self.assertBalances(20, -10, -10)
+
+    def test_body_not_a_list(self):
+        for body in (5, "dinner", None, {"description": "dinner"}):
+            response = self.client.post('/api/v1/expenses/bulk/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_row_not_an_object(self):
+        response = self.client.post('/api/v1/expenses/bulk/', [5], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 0)
+
+
+def count_lines(lines):
+    # the line by line counting the NumPy pipeline replaced
+    data = {}
+    for line in lines:
+        [_, timestamp, text] = line.split(" ")
+        value = data.setdefault(int(timestamp) // BUCKET_MS % BUCKETS_PER_DAY, {})
+        value[text.rstrip()] = value.get(text.rstrip(), 0) + 1
+    return data
+
+
+class LogPipelineTest(SimpleTestCase):
+    """
+        transform and aggregate must count every line the way the line by line parser did
+    """
+    lines = [
+        '1 1623000900000 NA',
+        '2 1623000900000 null',
+        '3 1623000900000 NaN',
+        '4 1623001800000 None',
+        '5 1623001800000 N/A',
+        '6 1623001800000 "Quoted',
+        '7 1623001800000 Unbalanced"',
+        '8 1623002700000 NullPointerException',
+        '9 1623002700000 #N/A',
+    ]
+
+    def count(self, *blocks):
+        return aggregate(transform([block.encode('utf-8') for block in blocks]))
+
+    def test_counts_match_line_by_line(self):
+        self.assertEqual(self.count('\n'.join(self.lines) + '\n'), count_lines(self.lines))
+
+    def test_counts_across_blocks(self):
+        blocks = ['\n'.join(self.lines[:4]) + '\n', '\n'.join(self.lines[4:])]
+        self.assertEqual(self.count(*blocks), count_lines(self.lines))
+
+    def test_rejects_malformed_lines(self):
+        for block in ['1 1623000900000 Two Words\n', '2 1623000900000 Ok\n1 1623000900000 Two Words\n',
+                      '\n1 1623000900000 Three Words Here\n', '2 1623000900000 Ok\n1 1623000900000 Three Words Here\n',
+                      '1 1623000900000\n', '1 soon Exception\n']:
+            with self.assertRaises(LogFormatError):
+                self.count(block)
+
+
+class SettlementTest(SimpleTestCase):
+    """
+        greedy and minimum_transfers on random groups against what a settlement must satisfy
+    """
+
+    def remaining(self, dues, transfers):
+        dues = dict(dues)
+        for from_user, to_user, amount in transfers:
+            self.assertGreater(amount, 0)
+            dues[from_user] += amount
+            dues[to_user] -= amount
+        return dues
+
+    def test_settles_all_dues(self):
+        rng = random.Random(0)
+        for members in range(1, EXACT_LIMIT + 1):
+            for _ in range(20):
+                amounts = [rng.choice([0, rng.randint(-5000, 5000)]) for _ in range(members - 1)]
+                dues = dict(enumerate(amounts + [-sum(amounts)]))
+                fast, exact = greedy(dues), minimum_transfers(dues)
+                for transfers in (fast, exact):
+                    self.assertEqual(set(self.remaining(dues, transfers).values()), {0})
+                self.assertLessEqual(len(exact), len(fast))
+
+    def test_unbalanced_dues(self):
+        for dues, left in [({1: 1000, 2: 500}, {1: 1000, 2: 500}),
+                           ({1: 1000, 2: -300, 3: -200}, {1: 500, 2: 0, 3: 0}),
+                           ({1: 300, 2: -1000, 3: 200}, {1: 0, 2: -500, 3: 0})]:
+            for solver in (greedy, minimum_transfers):
+                self.assertEqual(self.remaining(dues, solver(dues)), left)
+
+
+def total_count(body):
+    return sum(log['count'] for entry in body['response'] for log in entry['logs'])
+
+
+class LogEndpointTest(SimpleTestCase):
+    """
+        Every /process-logs/ variant must return the same counts for the same files
+    """
+
+    def setUp(self):
+        log_cache.clear()
+        lines = LogPipelineTest.lines * (READ_CHUNK_SIZE // 200)
+        self.files = [('\n'.join(lines[i:]) + '\n').encode('utf-8') for i in range(3)]
+        self.client = APIClient()
+
+    def post(self, url, log_files, mode='thread'):
+        return self.client.post(url, {'logFiles': log_files, 'parallelFileProcessingCount': 2, 'parsingMode': mode},
+                                format='json')
+
+    def test_modes_agree(self):
+        with LogServer(self.files) as server:
+            expected = self.post('/api/v1/process-logs/', server.urls()).json()
+            # each mode parses the files itself rather than revalidating the first mode's counts
+            log_cache.clear()
+            self.assertEqual(self.post('/api/v1/process-logs/', server.urls(), 'process').json(), expected)
+            log_cache.clear()
+            self.assertEqual(self.post('/api/v1/process-logs/async/', server.urls()).json(), expected)
+            self.assertNotIn(304, server.statuses)
+        counts = {}
+        for lines in self.files:
+            for index, value in count_lines(lines.decode('utf-8').splitlines()).items():
+                for text, count in value.items():
+                    counts[text] = counts.get(text, 0) + count
+        for entry in expected['response']:
+            for log in entry['logs']:
+                counts[log['exception']] -= log['count']
+        self.assertEqual(set(counts.values()), {0})
+
+    def test_revalidation(self):
+        for url, mode in [('/api/v1/process-logs/', 'thread'), ('/api/v1/process-logs/', 'process'),
+                          ('/api/v1/process-logs/async/', 'thread')]:
+            log_cache.clear()
+            with LogServer(list(self.files)) as server:
+                urls = server.urls()
+                once = self.post(url, urls[:2], mode).json()
+                self.assertEqual(server.statuses, [200, 200])
+                # a repeat request is answered 304 and served from the cached counts
+                self.assertEqual(self.post(url, urls[:2], mode).json(), once)
+                self.assertEqual(server.statuses[2:], [304, 304])
+                # a changed file is fetched and parsed again
+                server.files[1] = self.files[2]
+                changed = self.post(url, urls[:2], mode).json()
+                self.assertEqual(sorted(server.statuses[4:]), [200, 304])
+                log_cache.clear()
+                self.assertEqual(changed, self.post(url, [urls[0], urls[2]], mode).json())
+                # a url listed twice is fetched once and counted twice
+                fetched = len(server.statuses)
+                twice = self.post(url, [urls[0], urls[0]], mode).json()
+                self.assertEqual(server.statuses[fetched:], [304])
+                self.assertEqual(total_count(twice), 2 * total_count(self.post(url, urls[:1], mode).json()))
+
+    def test_missing_file(self):
+        with LogServer(self.files) as server:
+            missing = server.urls()[0].replace('0.log', 'missing.log')
+            for url, mode in [('/api/v1/process-logs/', 'thread'), ('/api/v1/process-logs/', 'process'),
+                              ('/api/v1/process-logs/async/', 'thread')]:
+                self.assertEqual(self.post(url, [missing], mode).status_code, 502)
+
+
+class TokenRevocationTest(APITransactionTestCase):
+    """
+        A cached token lookup must not outlive the token or a change to its user, in any process
+    """
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='owner', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        self.assertEqual(self.client.get('/api/v1/balances/').status_code, 200)
+        # what another worker process still holds
+        self.stale = token_cache.get(self.token.key)
+
+    def assertRevoked(self):
+        self.assertEqual(self.client.get('/api/v1/balances/').status_code, 401)
+        token_cache.put(self.token.key, self.stale)
+        self.assertEqual(self.client.get('/api/v1/balances/').status_code, 401)
+
+    def test_logout(self):
+        self.assertEqual(self.client.post('/api/v1/auth/logout/').status_code, 204)
+        self.assertRevoked()
+
+    def test_deleted_token(self):
+        self.token.delete()
+        self.assertRevoked()
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertRevoked()
+
+
+class LogJobTest(APITransactionTestCase):
+    """
+        /process-logs/jobs/ results must survive cache eviction, and a job its worker abandoned must not
+        stay running forever
+    """
+
+    def poll(self, job_id):
+        for _ in range(100):
+            body = self.client.get('/api/v1/process-logs/jobs/{}/'.format(job_id)).json()
+            if body['status'] not in (jobs.PENDING, jobs.RUNNING):
+                return body
+            time.sleep(0.05)
+        self.fail("job {} did not finish".format(job_id))
+
+    def test_result_outlives_cache(self):
+        job_id = jobs.submit(lambda: [{"exception": "NullPointerException", "count": 1}])
+        self.assertEqual(self.poll(job_id)['status'], jobs.SUCCESS)
+        cache.clear()
+        self.assertEqual(self.poll(job_id), {"status": jobs.SUCCESS,
+                                             "response": [{"exception": "NullPointerException", "count": 1}]})
+
+    def test_stale_job_failed(self):
+        stale = timezone.now() - timedelta(seconds=settings.LOG_JOB_STALE_AFTER + 1)
+        LogJob.objects.create(id='a' * 32, status=jobs.RUNNING, owner='web-1:42', heartbeat=stale)
+        body = self.poll('a' * 32)
+        self.assertEqual(body['status'], jobs.FAILURE)
+        self.assertIn('web-1:42', body['reason'])
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/v1/process-logs/jobs/{}/'.format('b' * 32))
+        self.assertEqual(response.status_code, 404)
@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken import views
 
 from restapi.views import user_view_set, category_view_set, group_view_set, expenses_view_set, index, logout, balance, \
-    logProcessor
+    logProcessor, logProcessorJob, logProcessorJobStatus, asyncLogProcessor, metricsView
 
 
 router = DefaultRouter()
@@ -17,7 +17,11 @@ urlpatterns = [
     path('auth/logout/', logout),
     path('auth/login/', views.obtain_auth_token),
     path('balances/', balance),
-    path('process-logs/', logProcessor)
+    path('process-logs/', logProcessor),
+    path('process-logs/async/', asyncLogProcessor),
+    path('process-logs/jobs/', logProcessorJob),
+    path('process-logs/jobs/<str:job_id>/', logProcessorJobStatus),
+    path('metrics/', metricsView)
 ]
 
 urlpatterns += router.urls
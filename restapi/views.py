@@ -1,33 +1,72 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
 import pandas as pd
 import numpy as np
-import urllib.request
-from datetime import datetime
-
-from django.http import HttpResponse
+import asyncio
+import csv
+import http.client
+import io
+import json
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import GeneratorType
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
 
 # Create your views here.
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import *
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework import status
 
 from restapi.models import *
 from restapi.serializers import *
 from restapi.custom_exception import *
-
+from restapi import async_http, jobs, ledger, metrics
+from restapi.http_pool import ConnectionPool, FetchError
+from restapi.log_cache import LogFile, conditional_headers, log_cache
+from restapi.bulk_import import import_expenses
+from restapi.money import format_cents, to_cents
+from restapi.pagination import KeysetOrOffsetPagination
+from restapi.parsers import NDJSONParser
+from restapi.process_pool import discard_process_pool, process_pool
+from restapi.response_cache import CATEGORIES_SCOPE, cached_response, expense_scopes, group_scope, \
+    invalidate, user_scope
+from restapi.search import search
+from restapi.settlement import greedy, settle
+
+FETCH_TIMEOUT = 60
+FETCH_RETRIES = 2
+READ_CHUNK_SIZE = 1024 * 1024
+BUCKET_MS = 15 * 60 * 1000
+BUCKETS_PER_DAY = 96
+PARSING_MODES = ('thread', 'process')
+# a first line with more fields than the parser's columns, which it would cut off without an error
+WIDE_FIRST_LINE = re.compile(rb'\s*\S+[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]+\S')
 
 
 def index(_request):
     return HttpResponse("Hello, world. You're at Rest.")
 
 
+def metricsView(_request):
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @api_view(['POST'])
 def logout(request):
+    # deleting the token revokes it in every process's token cache
     request.user.auth_token.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -35,10 +74,19 @@ def logout(request):
 @api_view(['GET'])
 def balance(request):
     user = request.user
-    expenses = Expenses.objects.filter(users__in=user.expenses.all())
+    return cached_response(request, 'balances:{}'.format(user.id), [user_scope(user.id)],
+                           lambda: user_balances(user))
+
+
+def user_balances(user):
+    # one row per participant of every expense the user takes part in, grouped by expense
+    dues = UserExpense.objects.filter(expense__users__user=user)\
+        .annotate(due=F('amount_lent') - F('amount_owed'))\
+        .order_by('expense_id', 'id')\
+        .values_list('expense_id', 'user_id', 'due')
     final_balance = {}
-    for expense in expenses:
-        expense_balances = normalize(expense)
+    for _, expense_dues in groupby(dues, key=itemgetter(0)):
+        expense_balances = normalize({user_id: to_cents(due) for _, user_id, due in expense_dues})
         for eb in expense_balances:
             from_user = eb['from_user']
             to_user = eb['to_user']
@@ -48,36 +96,23 @@ def balance(request):
                 final_balance[from_user] = final_balance.get(from_user, 0) + eb['amount']
     final_balance = {k: v for k, v in final_balance.items() if v != 0}
 
-    response = [{"user": k, "amount": int(v)} for k, v in final_balance.items()]
-    return Response(response, status=200)
+    return [{"user": k, "amount": format_cents(v)} for k, v in final_balance.items()]
 
 
-def normalize(expense):
-    user_balances = expense.users.all()
-    dues = {}
-    for user_balance in user_balances:
-        dues[user_balance.user] = dues.get(user_balance.user, 0) + user_balance.amount_lent \
-                                  - user_balance.amount_owed
-    dues = [(k, v) for k, v in sorted(dues.items(), key=lambda item: item[1])]
-    start = 0
-    end = len(dues) - 1
-    balances = []
-    while start < end:
-        amount = min(abs(dues[start][1]), abs(dues[end][1]))
-        user_balance = {"from_user": dues[start][0].id, "to_user": dues[end][0].id, "amount": amount}
-        balances.append(user_balance)
-        dues[start] = (dues[start][0], dues[start][1] + amount)
-        dues[end] = (dues[end][0], dues[end][1] - amount)
-        if dues[start][1] == 0:
-            start += 1
-        else:
-            end -= 1
-    return balances
+def normalize(dues):
+    """
+        Settle one expense's {user id: amount lent - amount owed, in cents} dues into transfers between users.
+        Greedy rather than exact: it runs once per expense on every uncached /balances/ request, and with a
+        single payer, the usual expense, greedy already needs the fewest transfers.
+    """
+    return [{"from_user": from_user, "to_user": to_user, "amount": amount}
+            for from_user, to_user, amount in greedy(dues)]
 
 
 class user_view_set(ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = KeysetOrOffsetPagination
     permission_classes = (AllowAny,)
 
 
@@ -86,16 +121,25 @@ class category_view_set(ModelViewSet):
     serializer_class = CategorySerializer
     http_method_names = ['get', 'post']
 
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, 'categories:{}'.format(request.get_full_path()), [CATEGORIES_SCOPE],
+                               lambda: super(category_view_set, self).list(request, *args, **kwargs).data)
+
+    def perform_create(self, serializer):
+        serializer.save()
+        invalidate([CATEGORIES_SCOPE])
+
 
 class group_view_set(ModelViewSet):
     queryset = Groups.objects.all()
     serializer_class = GroupSerializer
+    pagination_class = KeysetOrOffsetPagination
 
     def get_queryset(self):
         user = self.request.user
-        groups = user.members.all()
+        groups = user.members.prefetch_related('members')
         if self.request.query_params.get('q', None) is not None:
-            groups = groups.filter(name__icontains=self.request.query_params.get('q', None))
+            groups = search(groups, 'name', self.request.query_params.get('q', None))
         return groups
 
     def create(self, request, *args, **kwargs):
@@ -107,108 +151,203 @@ class group_view_set(ModelViewSet):
         serializer = self.get_serializer(group)
         return Response(serializer.data, status=201)
 
+    def get_member_group(self, pk):
+        """
+            The group pk if the requesting user is one of its members, looked up in a single indexed query
+        """
+        group = Groups.objects.filter(id=pk, members=self.request.user).first()
+        if group is None:
+            raise UnauthorizedUserException()
+        return group
+
     @action(methods=['put'], detail=True)
     def members(self, request, pk=None):
-        group = Groups.objects.get(id=pk)
-        if group not in self.get_queryset():
-            raise UnauthorizedUserException()
+        group = self.get_member_group(pk)
         body = request.data
         if body.get('add', None) is not None and body['add'].get('user_ids', None) is not None:
-            added_ids = body['add']['user_ids']
-            for user_id in added_ids:
-                group.members.add(user_id)
+            group.members.add(*body['add']['user_ids'])
         if body.get('remove', None) is not None and body['remove'].get('user_ids', None) is not None:
-            removed_ids = body['remove']['user_ids']
-            for user_id in removed_ids:
-                group.members.remove(user_id)
-        group.save()
+            group.members.remove(*body['remove']['user_ids'])
+        invalidate([group_scope(group.id)])
         return Response(status=204)
 
     @action(methods=['get'], detail=True)
-    def expenses(self, _request, pk=None):
-        group = Groups.objects.get(id=pk)
-        if group not in self.get_queryset():
-            raise UnauthorizedUserException()
-        expenses = group.expenses_set
-        serializer = ExpensesSerializer(expenses, many=True)
-        return Response(serializer.data, status=200)
+    def expenses(self, request, pk=None):
+        group = self.get_member_group(pk)
+        return cached_response(request, 'group-expenses:{}'.format(group.id), [group_scope(group.id)],
+                               lambda: ExpensesSerializer(group.expenses_set.prefetch_related('users'), many=True).data)
 
     @action(methods=['get'], detail=True)
-    def balances(self, _request, pk=None):
-        group = Groups.objects.get(id=pk)
-        if group not in self.get_queryset():
-            raise UnauthorizedUserException()
-        expenses = Expenses.objects.filter(group=group)
-        dues = {}
-        for expense in expenses:
-            user_balances = UserExpense.objects.filter(expense=expense)
-            for user_balance in user_balances:
-                dues[user_balance.user] = dues.get(user_balance.user, 0) + user_balance.amount_lent \
-                                          - user_balance.amount_owed
-        dues = [(k, v) for k, v in sorted(dues.items(), key=lambda item: item[1])]
-        start = 0
-        end = len(dues) - 1
-        balances = []
-        while start < end:
-            amount = min(abs(dues[start][1]), abs(dues[end][1]))
-            amount = Decimal(amount).quantize(Decimal(10)**-2)
-            user_balance = {"from_user": dues[start][0].id, "to_user": dues[end][0].id, "amount": str(amount)}
-            balances.append(user_balance)
-            dues[start] = (dues[start][0], dues[start][1] + amount)
-            dues[end] = (dues[end][0], dues[end][1] - amount)
-            if dues[start][1] == 0:
-                start += 1
-            else:
-                end -= 1
-
-        return Response(balances, status=200)
+    def balances(self, request, pk=None):
+        group = self.get_member_group(pk)
+        return cached_response(request, 'group-balances:{}'.format(group.id), [group_scope(group.id)],
+                               lambda: group_balances(group))
+
+    @action(methods=['get'], detail=False, url_path='balances')
+    def all_balances(self, request):
+        """
+            Settle all of the user's groups together instead of group by group
+        """
+        group_ids = list(request.user.members.order_by('id').values_list('id', flat=True))
+        return cached_response(request, 'cross-group-balances:{}'.format(','.join(map(str, group_ids))),
+                               [group_scope(group_id) for group_id in group_ids],
+                               lambda: group_balances(*group_ids))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        user_ids = UserExpense.objects.filter(expense__group=instance).values_list('user_id', flat=True).distinct()
+        invalidate(expense_scopes(instance.id, user_ids))
+        instance.delete()
+
+
+def group_balances(*groups):
+    """
+        Transfers settling the ledger of the given groups, netted across all of them
+    """
+    dues = {}
+    for user_id, amount in GroupBalance.objects.filter(group__in=groups).exclude(amount=0).order_by('id')\
+            .values_list('user_id', 'amount'):
+        dues[user_id] = dues.get(user_id, 0) + to_cents(amount)
+    return [{"from_user": from_user, "to_user": to_user, "amount": format_cents(amount)}
+            for from_user, to_user, amount in settle(dues)]
 
 
 class expenses_view_set(ModelViewSet):
     queryset = Expenses.objects.all()
     serializer_class = ExpensesSerializer
+    pagination_class = KeysetOrOffsetPagination
 
     def get_queryset(self):
         user = self.request.user
+        expenses = Expenses.objects.filter(users__user=user).distinct()
         if self.request.query_params.get('q', None) is not None:
-            expenses = Expenses.objects.filter(users__in=user.expenses.all())\
-                .filter(description__icontains=self.request.query_params.get('q', None))
-        else:
-            expenses = Expenses.objects.filter(users__in=user.expenses.all())
-        return expenses
+            expenses = search(expenses, 'description', self.request.query_params.get('q', None))
+        return expenses.prefetch_related('users')
+
+    @action(methods=['post'], detail=False, parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        rows = request.data
+        # a JSON array, or the generator NDJSONParser returns
+        if not isinstance(rows, (list, GeneratorType)):
+            return Response({"status": "failure", "reason": "Expected a list of expenses"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        created, errors = import_expenses(rows)
+        return Response({"created": created, "errors": errors},
+                        status=status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        dues = ledger.expense_dues(instance.users.all())
+        ledger.apply(instance.group_id, dues, -1)
+        invalidate(expense_scopes(instance.group_id, dues.keys()))
+        instance.delete()
+
+def validate_log_request(data):
+    """
+        Return the failure reason for an invalid /process-logs/ body, None when it is valid
+    """
+    if data['parallelFileProcessingCount'] <= 0 or data['parallelFileProcessingCount'] > 30:
+        return "Parallel Processing Count out of expected bounds"
+    if len(data['logFiles']) == 0:
+        return "No log files provided in request"
+    if data.get('parsingMode', 'thread') not in PARSING_MODES:
+        return "Unknown parsing mode"
+    return None
+
+
+def process_logs(log_files, num_threads, parsing_mode='thread'):
+    start = time.perf_counter()
+    log_reader = multiProcessReader if parsing_mode == 'process' else multiThreadedReader
+    data = log_reader(urls=log_files, num_threads=num_threads)
+    formatted = time.perf_counter()
+    response = response_format(data)
+    end = time.perf_counter()
+    metrics.LOG_FORMAT_SECONDS.observe(end - formatted)
+    metrics.LOG_REQUEST_SECONDS.observe(end - start, mode=parsing_mode)
+    return response
+
 
 @api_view(['post'])
 @authentication_classes([])
 @permission_classes([])
 def logProcessor(request):
     data = request.data
-    num_threads = data['parallelFileProcessingCount']
-    log_files = data['logFiles']
-    if num_threads <= 0 or num_threads > 30:
-        return Response({"status": "failure", "reason": "Parallel Processing Count out of expected bounds"},
-                        status=status.HTTP_400_BAD_REQUEST)
-    if len(log_files) == 0:
-        return Response({"status": "failure", "reason": "No log files provided in request"},
-                        status=status.HTTP_400_BAD_REQUEST)
-    logs = multiThreadedReader(urls=data['logFiles'], num_threads=data['parallelFileProcessingCount'])
-    sorted_logs = sort_by_time_stamp(logs)
-    cleaned = transform(sorted_logs)
-    data = aggregate(cleaned)
-    response = response_format(data)
+    reason = validate_log_request(data)
+    if reason is not None:
+        return Response({"status": "failure", "reason": reason}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        response = process_logs(data['logFiles'], data['parallelFileProcessingCount'],
+                                data.get('parsingMode', 'thread'))
+    except (FetchError, LogFormatError) as e:
+        return Response({"status": "failure", "reason": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
     return Response({"response":response}, status=status.HTTP_200_OK)
 
-def sort_by_time_stamp(logs):
-    data = []
-    for log in logs:
-        data.append(log.split(" "))
-    # print(data)
-    data = sorted(data, key=lambda elem: elem[1])
-    return data
+
+@api_view(['post'])
+@authentication_classes([])
+@permission_classes([])
+def logProcessorJob(request):
+    data = request.data
+    reason = validate_log_request(data)
+    if reason is not None:
+        return Response({"status": "failure", "reason": reason}, status=status.HTTP_400_BAD_REQUEST)
+    job_id = jobs.submit(process_logs, data['logFiles'], data['parallelFileProcessingCount'],
+                         data.get('parsingMode', 'thread'))
+    return Response({"status": jobs.PENDING, "jobId": job_id}, status=status.HTTP_202_ACCEPTED)
+
+
+async def asyncLogProcessor(request):
+    """
+        /process-logs/ as a native async view: under ASGI the downloads wait on the event loop instead of
+        holding a worker thread each, and only the parsing of each block takes an executor thread.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"status": "failure", "reason": "Request body is not valid JSON"},
+                            status=status.HTTP_400_BAD_REQUEST)
+    reason = validate_log_request(data)
+    if reason is None and data.get('parsingMode', 'thread') != 'thread':
+        reason = "Only the thread parsing mode is available here"
+    if reason is not None:
+        return JsonResponse({"status": "failure", "reason": reason}, status=status.HTTP_400_BAD_REQUEST)
+    start = time.perf_counter()
+    try:
+        unique_urls = list(dict.fromkeys(data['logFiles']))
+        cached = [log_cache.get(url) for url in unique_urls]
+        log_files = await async_fetch_logs(unique_urls, data['parallelFileProcessingCount'], cached)
+    except (FetchError, LogFormatError) as e:
+        return JsonResponse({"status": "failure", "reason": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+    formatted = time.perf_counter()
+    response = response_format(merge_log_files(data['logFiles'], unique_urls, log_files))
+    end = time.perf_counter()
+    metrics.LOG_FORMAT_SECONDS.observe(end - formatted)
+    metrics.LOG_REQUEST_SECONDS.observe(end - start, mode='async')
+    return JsonResponse({"response": response}, status=status.HTTP_200_OK)
+
+
+@api_view(['get'])
+@authentication_classes([])
+@permission_classes([])
+def logProcessorJobStatus(_request, job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return Response({"status": "failure", "reason": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job, status=status.HTTP_200_OK)
+
+def bucket_label(index):
+    start, end = index * 15, (index + 1) * 15 % (24 * 60)
+    return "{:02d}:{:02d}-{:02d}:{:02d}".format(start // 60, start % 60, end // 60, end % 60)
+
+BUCKET_LABELS = [bucket_label(index) for index in range(BUCKETS_PER_DAY)]
 
 def response_format(raw_data):
     response = []
-    for timestamp, data in raw_data.items():
-        entry = {'timestamp': timestamp}
+    for index in sorted(raw_data.keys()):
+        data = raw_data[index]
+        entry = {'timestamp': BUCKET_LABELS[index]}
         logs = []
         data = {k: data[k] for k in sorted(data.keys())}
         for exception, count in data.items():
@@ -217,56 +356,270 @@ def response_format(raw_data):
         response.append(entry)
     return response
 
-def aggregate(cleaned_logs):
-    data = {}
-    for log in cleaned_logs:
-        [key, text] = log
-        value = data.get(key, {})
-        value[text] = value.get(text, 0)+1
-        data[key] = value
+def aggregate(batches, data=None):
+    """
+        Count transformed batches into data as {bucket index: {exception: count}}
+    """
+    data = {} if data is None else data
+    for indices, exceptions in batches:
+        codes, names = pd.factorize(exceptions)
+        known = codes >= 0
+        counts = np.bincount(indices[known] * len(names) + codes[known], minlength=BUCKETS_PER_DAY * len(names))
+        counts = counts.reshape(BUCKETS_PER_DAY, len(names))
+        for index, code in zip(*np.nonzero(counts)):
+            value = data.setdefault(int(index), {})
+            value[names[code]] = value.get(names[code], 0) + int(counts[index, code])
     return data
 
 
-def transform(logs):
-    result = []
-    for log in logs:
-        [_, timestamp, text] = log
-        text = text.rstrip()
-        timestamp = datetime.utcfromtimestamp(int(int(timestamp)/1000))
-        hours, minutes = timestamp.hour, timestamp.minute
-        key = ''
+def merge(data, partial):
+    for index, counts in partial.items():
+        value = data.setdefault(index, {})
+        for text, count in counts.items():
+            value[text] = value.get(text, 0)+count
+    return data
 
-        if minutes >= 45:
-            if hours == 23:
-                key = "{:02d}:45-00:00".format(hours)
-            else:
-                key = "{:02d}:45-{:02d}:00".format(hours, hours+1)
-        elif minutes >= 30:
-            key = "{:02d}:30-{:02d}:45".format(hours, hours)
-        elif minutes >= 15:
-            key = "{:02d}:15-{:02d}:30".format(hours, hours)
-        else:
-            key = "{:02d}:00-{:02d}:15".format(hours, hours)
 
-        result.append([key, text])
-        print(key)
+def transform(blocks):
+    """
+        Parse blocks of whole lines into (bucket index array, exception array) batches, where the
+        bucket is the quarter-hour of the (UTC) day, 0 to BUCKETS_PER_DAY - 1
+    """
+    for block in blocks:
+        if WIDE_FIRST_LINE.match(block):
+            raise LogFormatError("a line has more than three fields")
+        try:
+            # exception names are taken verbatim: no NA values like 'null' or 'NA', no quoting. The extra
+            # column catches a fourth field; the parser itself fails on lines with more.
+            logs = pd.read_csv(io.BytesIO(block), sep=r"\s+", header=None, index_col=False,
+                               names=['id', 'timestamp', 'text', 'extra'],
+                               dtype={'id': str, 'timestamp': np.int64, 'text': str, 'extra': str},
+                               na_filter=False, quoting=csv.QUOTE_NONE)
+        except pd.errors.EmptyDataError:
+            continue
+        except ValueError as e:
+            raise LogFormatError(e)
+        if (logs['extra'] != '').any():
+            raise LogFormatError("a line has more than three fields")
+        if (logs['text'] == '').any():
+            raise LogFormatError("a line has fewer than three fields")
+        indices = logs['timestamp'].to_numpy() // BUCKET_MS % BUCKETS_PER_DAY
+        yield indices, logs['text'].to_numpy()
+
+
+class BlockSplitter(object):
+    """
+        Cuts a body arriving in chunks into blocks of whole lines, holding at most one chunk in memory
+    """
 
-    return result
+    def __init__(self):
+        self.pending = b''
 
+    def feed(self, chunk):
+        # the block of lines completed by chunk, None when chunk does not end a line
+        cut = chunk.rfind(b"\n") + 1
+        if cut == 0:
+            self.pending += chunk
+            return None
+        block, self.pending = self.pending + chunk[:cut], chunk[cut:]
+        return block
 
-def reader(url, timeout):
-    with urllib.request.urlopen(url, timeout=timeout) as conn:
-        return conn.read()
+    def rest(self):
+        return self.pending if self.pending.strip() else None
 
 
-def multiThreadedReader(urls, num_threads):
+def iter_blocks(response):
+    """
+        Split the body into blocks of whole lines as chunks arrive
+    """
+    splitter = BlockSplitter()
+    for chunk in iter(lambda: response.read(READ_CHUNK_SIZE), b''):
+        block = splitter.feed(chunk)
+        if block is not None:
+            yield block
+    if splitter.rest() is not None:
+        yield splitter.rest()
+
+
+async def aiter_blocks(response):
+    """
+        iter_blocks for a streaming httpx response
+    """
+    splitter = BlockSplitter()
+    async for chunk in response.aiter_bytes(READ_CHUNK_SIZE):
+        block = splitter.feed(chunk)
+        if block is not None:
+            yield block
+    if splitter.rest() is not None:
+        yield splitter.rest()
+
+
+def failed_attempt(url, error, attempt, retries):
+    """
+        Count a failed attempt at url and raise the error to report, unless another attempt is due
+    """
+    if isinstance(error, LogFormatError):
+        metrics.LOG_FETCH_ERRORS.inc(kind='format')
+        raise LogFormatError("Failed to parse {}: {}".format(url, error))
+    if not isinstance(error, FetchError):
+        error = FetchError(url, error)
+    metrics.LOG_FETCH_ERRORS.inc(kind=metrics.fetch_error_kind(error.reason))
+    if not error.retryable or attempt == retries:
+        raise error
+
+
+def reader(url, timeout, pool=None, retries=FETCH_RETRIES, cached=None):
+    """
+        Stream url through the parse pipeline and return it as a LogFile of aggregated buckets.
+        When cached is given the fetch is conditional, and cached itself is returned if it is still fresh.
+    """
+    if pool is None:
+        with ConnectionPool(timeout=timeout) as pool:
+            return reader(url, timeout, pool, retries, cached)
+    for attempt in range(retries + 1):
+        try:
+            start = time.perf_counter()
+            with pool.request(url, conditional_headers(cached)) as response:
+                if response.status == 304 and cached is not None:
+                    response.read()
+                    metrics.LOG_NOT_MODIFIED.inc()
+                    return cached
+                # parsing pulls blocks from the body as it goes, so time spent in the inner iterator is
+                # network wait and the remainder of each outer step is parsing
+                totals = defaultdict(float)
+                blocks = metrics.timed_iter(iter_blocks(response), totals, 'fetch')
+                batches = metrics.timed_iter(transform(blocks), totals, 'parse', size=lambda batch: len(batch[0]))
+                connected = time.perf_counter() - start
+                # a failed attempt is thrown away whole, so a retry never counts a line twice
+                data = aggregate(batches)
+                elapsed = time.perf_counter() - start
+                metrics.record_log_file(connected + totals['fetch'], totals['parse'] - totals['fetch'],
+                                        elapsed - connected - totals['parse'], int(totals['fetch_size']),
+                                        int(totals['parse_size']))
+                return LogFile(response.getheader('ETag'), response.getheader('Last-Modified'), data)
+        except (FetchError, LogFormatError, OSError, http.client.HTTPException) as e:
+            failed_attempt(url, e, attempt, retries)
+
+
+def parse_block(block, data, totals):
+    start = time.perf_counter()
+    aggregate(metrics.timed_iter(transform([block]), totals, 'parse', size=lambda batch: len(batch[0])), data)
+    totals['cpu'] += time.perf_counter() - start
+    totals['fetch_size'] += len(block)
+
+
+async def async_reader(url, client, semaphore, retries=FETCH_RETRIES, cached=None):
+    """
+        reader without blocking the event loop: the download waits on the loop while each block is parsed
+        in the loop's default executor, holding semaphore while the file is fetched
     """
-        Read multiple files through HTTP
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                start = time.perf_counter()
+                async with async_http.request(client, url, conditional_headers(cached)) as response:
+                    if response.status_code == 304 and cached is not None:
+                        metrics.LOG_NOT_MODIFIED.inc()
+                        return cached
+                    data = {}
+                    totals = defaultdict(float)
+                    async for block in aiter_blocks(response):
+                        await loop.run_in_executor(None, parse_block, block, data, totals)
+                    elapsed = time.perf_counter() - start
+                    metrics.record_log_file(elapsed - totals['cpu'], totals['parse'], totals['cpu'] - totals['parse'],
+                                            int(totals['fetch_size']), int(totals['parse_size']))
+                    return LogFile(response.headers.get('ETag'), response.headers.get('Last-Modified'), data)
+            except (FetchError, LogFormatError) as e:
+                failed_attempt(url, e, attempt, retries)
+
+
+async def async_fetch_logs(urls, num_threads, cached):
     """
-    result = []
+        fetch_logs on the event loop, with at most num_threads downloads of this request in flight
+    """
+    semaphore = asyncio.Semaphore(num_threads)
+    async with async_http.client(FETCH_TIMEOUT, num_threads) as client:
+        tasks = [asyncio.ensure_future(async_reader(url, client, semaphore, cached=entry))
+                 for url, entry in zip(urls, cached)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+def fetch_logs(urls, num_threads, cached):
+    """
+        Read multiple files through HTTP, up to num_threads at a time over keep-alive connections.
+        Returns one LogFile per url, in the order of urls.
+    """
+    with ConnectionPool(timeout=FETCH_TIMEOUT) as pool, ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return list(executor.map(lambda url, entry: reader(url, FETCH_TIMEOUT, pool, cached=entry), urls, cached))
+
+
+def fetch_logs_in_worker(urls, num_threads, cached):
+    """
+        fetch_logs for a worker process. The metrics it records are returned to the parent along with
+        the files, or with the FetchError or LogFormatError that stopped it.
+    """
+    metrics.registry.reset()
+    try:
+        return fetch_logs(urls, num_threads, cached), None, metrics.registry.export()
+    except (FetchError, LogFormatError) as e:
+        return None, e, metrics.registry.export()
+
+
+def merge_log_files(urls, unique_urls, log_files):
+    start = time.perf_counter()
+    data = {}
+    by_url = dict(zip(unique_urls, log_files))
+    for url, log_file in by_url.items():
+        log_cache.put(url, log_file)
+    # merged in the order of urls, so the result does not depend on which download finishes first
     for url in urls:
-        data = reader(url, 60)
-        data = data.decode('utf-8')
-        result.extend(data.split("\n"))
-    result = sorted(result, key=lambda elem:elem[1])
-    return result
\ No newline at end of file
+        merge(data, by_url[url].data)
+    metrics.LOG_MERGE_SECONDS.observe(time.perf_counter() - start)
+    return data
+
+
+def multiThreadedReader(urls, num_threads):
+    """
+        Read and aggregate multiple files through HTTP, revalidating the ones already in log_cache
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    cached = [log_cache.get(url) for url in unique_urls]
+    return merge_log_files(urls, unique_urls, fetch_logs(unique_urls, num_threads, cached))
+
+
+def multiProcessReader(urls, num_threads):
+    """
+        Read and aggregate multiple files through HTTP, sharding them across worker processes so parsing
+        uses every core. Each process fetches its shard with its part of the num_threads budget.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    cached = [log_cache.get(url) for url in unique_urls]
+    num_processes = min(num_threads, len(unique_urls), settings.LOG_PROCESS_WORKERS)
+    shards = [unique_urls[i::num_processes] for i in range(num_processes)]
+    cached_shards = [cached[i::num_processes] for i in range(num_processes)]
+    threads = [max(1, num_threads // num_processes)] * num_processes
+    log_files = [None] * len(unique_urls)
+    error = None
+    executor = process_pool()
+    try:
+        results = list(executor.map(fetch_logs_in_worker, shards, threads, cached_shards))
+    except BrokenProcessPool:
+        # a worker died; the next request starts a new pool
+        discard_process_pool(executor)
+        raise
+    for i, (shard, shard_error, shard_metrics) in enumerate(results):
+        metrics.registry.merge(shard_metrics)
+        if shard_error is not None:
+            error = error or shard_error
+            continue
+        log_files[i::num_processes] = shard
+    if error is not None:
+        raise error
+    return merge_log_files(urls, unique_urls, log_files)
+